@@ -1,8 +1,12 @@
 """
 MarTech Analyzer Pro v5.0 - KOMPLETT
-Block 1: Core & Modern Design
+Block 1: Core & Modern Design (adaptives Crawling: MARTECH_ADAPTIVE_CRAWL)
 Block 2: GTM Deep-Dive
 Block 3: Company Intelligence with AI
+Block 4: Tool Detection (Fingerprints: fingerprints.json)
+Block 4b: Performance Impact (Tracking Weight)
+Monitoring: Watchlist + Worker (python monitor_worker.py)
+Snapshot-Archiv: WARC-Captures jeder Analyse, Offline-Replay (python replay_archive.py)
 
 Installation:
 pip install streamlit requests beautifulsoup4 google-generativeai pandas python-whois
@@ -15,12 +19,29 @@ import streamlit as st
 import requests
 from bs4 import BeautifulSoup
 import json
+import os
 import re
 from urllib.parse import urljoin, urlparse, quote_plus
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import sqlite3
 import pandas as pd
 import time
+import hashlib
+import zlib
+import gzip
+import io
+import uuid
+import http.client
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from http.cookiejar import DefaultCookiePolicy
+from types import SimpleNamespace
+import urllib3
+from requests.adapters import HTTPAdapter
+from requests.cookies import extract_cookies_to_jar
 
 try:
     import whois
@@ -42,6 +63,21 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+def get_gemini_api_key():
+    """Gemini-Key aus st.secrets oder Umgebungsvariable (Worker ohne secrets.toml)"""
+    try:
+        if "GEMINI_API_KEY" in st.secrets:
+            return st.secrets["GEMINI_API_KEY"]
+    except Exception:
+        pass
+    return os.environ.get("GEMINI_API_KEY")
+
+def quiet_streamlit_logs():
+    """Streamlit-Warnungen stummschalten, wenn die App ohne `streamlit run` importiert wird (Worker, Tests)"""
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
 # ==================== MODERN DESIGN ====================
 st.markdown("""
 <style>
@@ -183,80 +219,506 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ==================== DATABASE ====================
+DB_PATH = os.environ.get("MARTECH_DB", "martech_v5.db")
+
 def init_database():
-    conn = sqlite3.connect('martech_v5.db', check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS analyses (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         url TEXT, domain TEXT, timestamp TEXT,
         overall_score INTEGER, raw_data TEXT
     )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS watchlist (
+        domain TEXT PRIMARY KEY,
+        url TEXT, interval_minutes INTEGER, enabled INTEGER,
+        next_run TEXT, last_run TEXT, last_analysis_id INTEGER
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS page_state (
+        url TEXT PRIMARY KEY,
+        domain TEXT, etag TEXT, last_modified TEXT,
+        content_hash TEXT, body BLOB, fetched_at TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS container_state (
+        container_id TEXT PRIMARY KEY,
+        etag TEXT, last_modified TEXT, content_hash TEXT, fetched_at TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS script_state (
+        url TEXT PRIMARY KEY,
+        etag TEXT, last_modified TEXT, content_hash TEXT, fetched_at TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS analysis_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        domain TEXT, timestamp TEXT,
+        analysis_id INTEGER, previous_analysis_id INTEGER,
+        alert INTEGER, stages_run TEXT, diff TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS snapshots (
+        capture_id TEXT PRIMARY KEY,
+        domain TEXT, url TEXT, timestamp TEXT,
+        analysis_id INTEGER, records INTEGER, bytes INTEGER
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS snapshot_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        capture_id TEXT, url TEXT, record_type TEXT, status INTEGER,
+        timestamp TEXT, file TEXT, offset INTEGER, length INTEGER
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_domain ON snapshots (domain, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_snapshot_records_url ON snapshot_records (url, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_snapshot_records_capture ON snapshot_records (capture_id)')
     conn.commit()
     conn.close()
 
 def save_analysis(url, domain, score, raw_data):
-    conn = sqlite3.connect('martech_v5.db', check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     c = conn.cursor()
     c.execute('INSERT INTO analyses (url, domain, timestamp, overall_score, raw_data) VALUES (?, ?, ?, ?, ?)',
               (url, domain, datetime.now().isoformat(), score, json.dumps(raw_data)))
+    analysis_id = c.lastrowid
     conn.commit()
     conn.close()
+    return analysis_id
+
+def load_analysis(analysis_id):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('SELECT raw_data FROM analyses WHERE id = ?', (analysis_id,))
+    row = c.fetchone()
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+def get_latest_analysis_id(domain):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('SELECT id FROM analyses WHERE domain = ? ORDER BY id DESC LIMIT 1', (domain,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+# ==================== CACHING ====================
+CACHE_BUDGET_MB = int(os.environ.get("MARTECH_CACHE_MB", "64"))  # pro Prozess
+
+_caches = []
+
+def estimate_size(value):
+    """Grobe Größe eines Cache-Eintrags in Bytes (JSON-Länge)"""
+    return len(json.dumps(value, default=str).encode('utf-8'))
+
+class BoundedCache:
+    """Thread-sicherer LRU-Cache mit Byte-Budget und optionaler TTL"""
+    
+    def __init__(self, name, max_bytes, ttl=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        _caches.append(self)
+    
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl and time.time() - item[2] > self.ttl:
+                del self._data[key]
+                self._bytes -= item[1]
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+    
+    def set(self, key, value, size=None):
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._data.pop(key)[1]
+            if size > self.max_bytes:
+                return  # Zu groß: nicht cachen, aber auch keinen veralteten Stand behalten
+            self._data[key] = (value, size, time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, old_size, _) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "cache": self.name,
+                "entries": len(self._data),
+                "used_mb": round(self._bytes / 1024 / 1024, 2),
+                "budget_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+def get_process_memory_mb():
+    """Aktueller RSS des Prozesses (Linux), sonst Peak-RSS"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        return None
+
+def get_memory_report():
+    return {
+        "rss_mb": get_process_memory_mb(),
+        "budget_mb": CACHE_BUDGET_MB,
+        "caches": [cache.stats() for cache in _caches]
+    }
+
+# Kompakte Analysen (ohne HTML) für die Ansichten aller Sessions
+_analysis_cache = BoundedCache("analyses", CACHE_BUDGET_MB * 1024 * 1024 * 3 // 4)
+
+def strip_heavy_data(raw_data):
+    """Entfernt HTML & Seitenstände, behält alles, was die Ansichten brauchen"""
+    lean = dict(raw_data)
+    lean["crawl"] = {k: v for k, v in raw_data["crawl"].items() if k not in ("combined_html", "page_states")}
+    return lean
+
+def get_analysis_view(analysis_id):
+    """Lädt eine Analyse lazy aus der DB (geteilter Cache über alle Sessions)"""
+    view = _analysis_cache.get(analysis_id)
+    if view is None:
+        raw_data = load_analysis(analysis_id)
+        if raw_data is None:
+            return None
+        view = strip_heavy_data(raw_data)
+        _analysis_cache.set(analysis_id, view)
+    return view
+
+def summarize_analysis(result):
+    """Kompakte Zusammenfassung für st.session_state"""
+    return {
+        "domain": result["domain"],
+        "score": result["overall_score"],
+        "grade": result["gtm"]["implementation_quality"]["grade"],
+        "total_pages": result["crawl"]["total_pages"],
+        "containers": result["gtm"]["containers"],
+        "partial": result["deadline"]["partial"],
+        "timestamp": datetime.now().isoformat()
+    }
+
+# ==================== DEADLINE ====================
+ANALYSIS_DEADLINE_SECONDS = float(os.environ.get("MARTECH_DEADLINE", "20"))
+CRAWL_BUDGET_SHARE = 0.5   # Unterseiten nur, solange mehr als die Hälfte übrig ist
+MIN_REQUEST_SECONDS = 0.5  # darunter lohnt kein Request mehr
+
+# Blockierende Clients (WHOIS, Gemini): eigener Pool je Abhängigkeit,
+# damit ein hängender Dienst dem anderen keine Worker wegnimmt
+_blocking_pools = {
+    "whois": ThreadPoolExecutor(max_workers=8, thread_name_prefix="martech-whois"),
+    "gemini": ThreadPoolExecutor(max_workers=8, thread_name_prefix="martech-gemini")
+}
+
+class PartialResult(Exception):
+    """Stufe wurde durch die Deadline gekürzt (Ergebnis darf nicht gecacht werden)"""
+    
+    def __init__(self, result):
+        super().__init__("partial result")
+        self.result = result
+
+class Deadline:
+    """Gemeinsames Zeitbudget einer Analyse über alle Stufen"""
+    
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.skipped = []
+        self._lock = threading.Lock()
+    
+    def remaining(self):
+        return max(0.0, self.seconds - (time.monotonic() - self.started))
+    
+    def expired(self):
+        return self.remaining() < MIN_REQUEST_SECONDS
+    
+    def timeout(self, cap):
+        """Timeout für einen Einzelschritt: höchstens cap, höchstens das Restbudget"""
+        return min(cap, self.remaining())
+    
+    def skip(self, stage, detail):
+        with self._lock:
+            self.skipped.append({"stage": stage, "detail": detail})
+    
+    def report(self):
+        return {
+            "budget_s": self.seconds,
+            "elapsed_s": round(time.monotonic() - self.started, 2),
+            "partial": bool(self.skipped),
+            "skipped": list(self.skipped)
+        }
+
+def call_with_timeout(dependency, fn, timeout, *args, **kwargs):
+    """Blockierenden Aufruf nach timeout Sekunden aufgeben
+    
+    fn braucht selbst ein Timeout, sonst bleibt der Worker belegt;
+    noch nicht gestartete Aufrufe werden abgebrochen.
+    """
+    future = _blocking_pools[dependency].submit(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise
+
+# Eigene Timeouts der Clients: requests/urllib3 (auch beim Body-Lesen), Socket, google-api-core
+CLIENT_TIMEOUT_ERRORS = ("ReadTimeoutError", "ConnectTimeoutError", "DeadlineExceeded")
+
+def is_timeout(error):
+    """Gilt der Fehler als Zeitüberschreitung (wie FutureTimeout zu behandeln)?"""
+    if isinstance(error, (FutureTimeout, TimeoutError, requests.exceptions.Timeout)):
+        return True
+    causes = [error, *error.args[:1]]
+    return any(type(cause).__name__ in CLIENT_TIMEOUT_ERRORS for cause in causes)
+
+def run_stage(fn, *args, **kwargs):
+    """Gecachte Stufe ausführen; gekürzte Ergebnisse kommen ungecacht zurück"""
+    try:
+        return fn(*args, **kwargs)
+    except PartialResult as e:
+        return e.result
 
 # ==================== BLOCK 1: CRAWLING ====================
-def crawl_multiple_pages(base_url, max_pages=7):
-    """Intelligentes Multi-Page Crawling"""
+def collect_script_urls(soup, page_url, script_urls):
+    """Sammelt <script src> URLs einer Seite (ohne Duplikate)"""
+    for script in soup.find_all('script', src=True):
+        script_url = urljoin(page_url, script['src'].strip()).split('#')[0]
+        if script_url.startswith(('http://', 'https://')) and script_url not in script_urls:
+            script_urls.append(script_url)
+
+def fetch_page(url, timeout, headers, page_cache=None, session=None):
+    """Lädt eine Seite, optional als Conditional Request gegen den Page-Cache"""
+    cached = page_cache.get(url) if page_cache is not None else None
+    request_headers = dict(headers)
+    if cached:
+        if cached.get("etag"):
+            request_headers['If-None-Match'] = cached["etag"]
+        if cached.get("last_modified"):
+            request_headers['If-Modified-Since'] = cached["last_modified"]
+    
+    resp = (session or requests).get(url, timeout=timeout, headers=request_headers)
+    
+    if resp.status_code == 304 and cached:
+        return {**cached, "changed": False}
+    if resp.status_code != 200:
+        return None
+    
+    html = resp.text
+    content_hash = hashlib.sha256(html.encode('utf-8', errors='ignore')).hexdigest()
+    return {
+        "body": html,
+        "cookies": list(resp.cookies.keys()),
+        "etag": resp.headers.get('ETag'),
+        "last_modified": resp.headers.get('Last-Modified'),
+        "content_hash": content_hash,
+        "changed": not cached or cached.get("content_hash") != content_hash
+    }
+
+# Adaptives Crawling: Stopp, sobald Seiten nichts Neues mehr liefern
+CRAWL_ADAPTIVE = os.environ.get("MARTECH_ADAPTIVE_CRAWL", "1") == "1"
+ADAPTIVE_PATIENCE = 2     # Unterseiten in Folge ohne neue Signale -> Stopp
+ADAPTIVE_STEP = 2         # Budget-Erhöhung, solange neue Signale auftauchen
+ADAPTIVE_MAX_PAGES = 15
+
+PRIORITY_KEYWORDS = ['about', 'ueber', 'uber', 'company', 'unternehmen',
+                     'products', 'produkte', 'services', 'pricing', 'contact']
+
+DATALAYER_PUSH_PATTERN = re.compile(r'dataLayer\.push\s*\(\s*({.*?})\s*\)', re.DOTALL)
+DATALAYER_KEY_PATTERN = re.compile(r"['\"]?([a-zA-Z_][a-zA-Z0-9_]*)['\"]?\s*:")
+DATALAYER_EVENT_PATTERN = re.compile(r"['\"]event['\"]:\s*['\"]([^'\"]+)['\"]")
+SOCIAL_PATTERN = re.compile(r'(linkedin\.com/company|facebook\.com|twitter\.com|instagram\.com)/[^/\s"\']+')
+
+def extract_page_signals(html, soup, script_urls, cookies):
+    """Detektions-Signale einer Seite: Container, Events, Variablen, Tools & Firmendaten"""
+    signals = {f"container:{c}" for c in re.findall(r'GTM-[A-Z0-9]{4,10}', html)}
+    
+    for push in DATALAYER_PUSH_PATTERN.findall(html):
+        signals.update(f"event:{e}" for e in DATALAYER_EVENT_PATTERN.findall(push))
+        signals.update(f"variable:{v}" for v in DATALAYER_KEY_PATTERN.findall(push) if v != 'event')
+    
+    signals.update(f"tool:{name}" for name in detect_tools(html, script_urls, cookies)["tools"])
+    
+    signals.update(f"company:social:{m}" for m in SOCIAL_PATTERN.findall(html))
+    for meta in soup.find_all('meta'):
+        if meta.get('property') == 'og:site_name' or meta.get('name') == 'description':
+            signals.add(f"company:meta:{meta.get('property') or meta.get('name')}")
+    return signals
+
+def collect_priority_links(soup, page_url, base_url, queue):
+    """Hängt interne Links mit Prioritäts-Keywords in Dokument-Reihenfolge an"""
+    base_netloc = urlparse(base_url).netloc
+    for link in soup.find_all('a', href=True):
+        full_url = urljoin(page_url, link['href']).split('#')[0]
+        if urlparse(full_url).netloc == base_netloc and full_url not in queue:
+            if any(kw in full_url.lower() for kw in PRIORITY_KEYWORDS):
+                queue.append(full_url)
+
+def crawl_multiple_pages(base_url, max_pages=7, page_cache=None, deadline=None, adaptive=CRAWL_ADAPTIVE, session=None):
+    """Intelligentes Multi-Page Crawling
+    
+    Mit page_cache (URL -> gespeicherter Seitenstand) werden Conditional
+    Requests gesendet; das Ergebnis enthält dann zusätzlich "page_states"
+    und "changed_pages". Mit deadline werden Unterseiten nur geladen,
+    solange genug Budget für die folgenden Stufen bleibt.
+    
+    Adaptiv stoppt der Crawl nach ADAPTIVE_PATIENCE Unterseiten ohne neue
+    Signale und erhöht das Seitenbudget (bis ADAPTIVE_MAX_PAGES), solange
+    jede Seite noch Neues liefert; Details unter "adaptive". Mit session
+    (ArchiveSession) wird archiviert bzw. offline abgespielt.
+    """
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-    urls_to_visit = {base_url}
+    queue = [base_url]
     processed_urls = set()
-    all_html = ""
+    all_html_parts = []
     pages_info = []
+    script_urls = []
+    cookie_names = set()
+    page_states = {}
+    
+    seen_signals = set()
+    budget = max_pages
+    attempts = 1  # Startseite; fehlgeschlagene Unterseiten zählen mit
+    stale_pages = 0
+    stop_reason = "keine weiteren Links"
+    
+    def process(url, page, default_title):
+        soup = BeautifulSoup(page["body"], 'html.parser')
+        processed_urls.add(url)
+        page_states[url] = page
+        all_html_parts.append(page["body"])
+        cookie_names.update(page.get("cookies", []))
+        
+        page_scripts = []
+        collect_script_urls(soup, url, page_scripts)
+        script_urls.extend(u for u in page_scripts if u not in script_urls)
+        
+        title = soup.title.string if soup.title else default_title
+        info = {"url": url, "title": title, "status": "✓"}
+        if adaptive:
+            new_signals = extract_page_signals(page["body"], soup, page_scripts, page.get("cookies", [])) - seen_signals
+            seen_signals.update(new_signals)
+            info["new_signals"] = len(new_signals)
+        pages_info.append(info)
+        
+        if url == base_url or adaptive:
+            collect_priority_links(soup, url, base_url, queue)
+        return info
     
-    priority_keywords = ['about', 'ueber', 'uber', 'company', 'unternehmen', 
-                        'products', 'produkte', 'services', 'pricing', 'contact']
+    def crawl_time():
+        """Zeit für die nächste Unterseite: die Hälfte des Budgets bleibt den folgenden Stufen"""
+        return min(10, deadline.remaining() - deadline.seconds * CRAWL_BUDGET_SHARE) if deadline else 10
     
     try:
-        resp = requests.get(base_url, timeout=15, headers=headers)
-        if resp.status_code == 200:
-            soup = BeautifulSoup(resp.content, 'html.parser')
-            processed_urls.add(base_url)
-            all_html += resp.text + "\n"
-            
-            title = soup.title.string if soup.title else "Homepage"
-            pages_info.append({"url": base_url, "title": title, "status": "✓"})
+        page = fetch_page(base_url, deadline.timeout(15) if deadline else 15, headers, page_cache, session)
+        if page:
+            process(base_url, page, "Homepage")
+        
+        position = 1
+        while position < len(queue):
+            if attempts >= budget:
+                # Liefert noch jede Seite Neues, lohnt sich ein größeres Budget
+                if adaptive and stale_pages == 0 and budget < ADAPTIVE_MAX_PAGES:
+                    budget = min(ADAPTIVE_MAX_PAGES, budget + ADAPTIVE_STEP)
+                else:
+                    stop_reason = "Seitenbudget erreicht"
+                    break
+            if adaptive and stale_pages >= ADAPTIVE_PATIENCE:
+                stop_reason = "keine neuen Signale"
+                break
+            if not (session and session.offline):
+                time.sleep(0.3)
+            if crawl_time() < MIN_REQUEST_SECONDS:
+                remaining = min(len(queue) - position, budget - attempts)
+                deadline.skip("crawl", f"{remaining} Unterseiten nicht geladen")
+                stop_reason = "Deadline"
+                break
             
-            for link in soup.find_all('a', href=True):
-                full_url = urljoin(base_url, link['href'])
-                if urlparse(full_url).netloc == urlparse(base_url).netloc:
-                    if any(kw in full_url.lower() for kw in priority_keywords):
-                        urls_to_visit.add(full_url)
-        
-        for url in list(urls_to_visit)[1:max_pages]:
-            if url in processed_urls:
-                continue
+            url = queue[position]
+            position += 1
+            attempts += 1
+            info = {}
             try:
-                time.sleep(0.3)
-                resp = requests.get(url, timeout=10, headers=headers)
-                if resp.status_code == 200:
-                    soup = BeautifulSoup(resp.content, 'html.parser')
-                    all_html += resp.text + "\n"
-                    processed_urls.add(url)
-                    title = soup.title.string if soup.title else "Page"
-                    pages_info.append({"url": url, "title": title, "status": "✓"})
-            except:
-                continue
+                page = fetch_page(url, crawl_time(), headers, page_cache, session)
+                if page:
+                    info = process(url, page, "Page")
+            except Exception as e:
+                if deadline and is_timeout(e):
+                    deadline.skip("crawl", f"{url} nicht geladen (Timeout)")
+            
+            # Fehlgeschlagene Seiten zählen als Seiten ohne neue Signale
+            if adaptive:
+                stale_pages = 0 if info.get("new_signals") else stale_pages + 1
         
-        return {
+        all_html = "\n".join(all_html_parts) + "\n" if all_html_parts else ""
+        crawl_data = {
             "combined_html": all_html,
             "pages": pages_info,
+            "scripts": script_urls,
+            "cookies": sorted(cookie_names),
             "total_pages": len(processed_urls)
         }
+        if adaptive:
+            crawl_data["adaptive"] = {
+                "budget": budget,
+                "stop_reason": stop_reason,
+                "signals": len(seen_signals),
+                "links_found": len(queue) - 1
+            }
+        if page_cache is not None:
+            crawl_data["page_states"] = page_states
+            crawl_data["changed_pages"] = [u for u, p in page_states.items() if p["changed"]]
+        return crawl_data
     except:
         return None
 
 # ==================== BLOCK 2: GTM DEEP-DIVE ====================
-@st.cache_data(ttl=3600)
-def ultra_precise_gtm_analysis(html_content):
-    """Ultra-präzise GTM-Analyse"""
+GTM_JS_URL = os.environ.get("MARTECH_GTM_JS_URL", "https://www.googletagmanager.com/gtm.js")
+
+TAG_SIGNATURES = {
+    "Google Analytics 4": [r'google-analytics\.com/g/collect', r'measurement_id.*G-'],
+    "Google Analytics Universal": [r'google-analytics\.com/analytics\.js'],
+    "Google Ads": [r'googleadservices\.com', r'AW-\d+'],
+    "Campaign Manager 360": [r'fls\.doubleclick\.net'],
+    "Meta Pixel": [r'connect\.facebook\.net'],
+    "LinkedIn Insight": [r'snap\.licdn\.com'],
+    "TikTok Pixel": [r'analytics\.tiktok\.com'],
+    "Hotjar": [r'static\.hotjar\.com'],
+    "Microsoft Clarity": [r'clarity\.ms'],
+    "HubSpot": [r'js\.hs-scripts\.com']
+}
+
+def match_tag_signatures(content):
+    """Liefert alle Tags, deren Signatur im Content vorkommt"""
+    found = []
+    for tag_name, patterns in TAG_SIGNATURES.items():
+        for pattern in patterns:
+            if re.search(pattern, content, re.IGNORECASE):
+                found.append(tag_name)
+                break
+    return found
+
+@st.cache_data(ttl=3600, max_entries=256)
+def ultra_precise_gtm_analysis(html_content, _deadline=None, _session=None):
+    """Ultra-präzise GTM-Analyse
+    
+    Läuft die Deadline ab, werden restliche Container übersprungen und das
+    Teilergebnis als PartialResult geworfen (wird nicht gecacht).
+    """
     
     analysis = {
         "containers": [],
@@ -343,37 +805,29 @@ def ultra_precise_gtm_analysis(html_content):
     for container_id in analysis["containers"]:
         container_analysis = {"id": container_id, "accessible": False, "size_kb": 0, "tags_detected": []}
         
+        if _deadline and _deadline.expired():
+            container_analysis["skipped"] = True
+            _deadline.skip("gtm", f"Container {container_id} nicht geladen")
+            analysis["container_details"][container_id] = container_analysis
+            continue
+        
         try:
-            gtm_url = f"https://www.googletagmanager.com/gtm.js?id={container_id}"
-            resp = requests.get(gtm_url, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
+            gtm_url = f"{GTM_JS_URL}?id={container_id}"
+            started = time.perf_counter()
+            resp = (_session or requests).get(gtm_url, timeout=_deadline.timeout(10) if _deadline else 10, headers={'User-Agent': 'Mozilla/5.0'})
             
             if resp.status_code == 200:
                 container_analysis["accessible"] = True
+                container_analysis["transfer"] = transfer_metrics(gtm_url, resp, started, len(resp.content))
                 gtm_content = resp.text
                 container_analysis["size_kb"] = round(len(gtm_content) / 1024, 2)
                 
-                tag_sigs = {
-                    "Google Analytics 4": [r'google-analytics\.com/g/collect', r'measurement_id.*G-'],
-                    "Google Analytics Universal": [r'google-analytics\.com/analytics\.js'],
-                    "Google Ads": [r'googleadservices\.com', r'AW-\d+'],
-                    "Campaign Manager 360": [r'fls\.doubleclick\.net'],
-                    "Meta Pixel": [r'connect\.facebook\.net'],
-                    "LinkedIn Insight": [r'snap\.licdn\.com'],
-                    "TikTok Pixel": [r'analytics\.tiktok\.com'],
-                    "Hotjar": [r'static\.hotjar\.com'],
-                    "Microsoft Clarity": [r'clarity\.ms'],
-                    "HubSpot": [r'js\.hs-scripts\.com']
-                }
-                
-                for tag_name, patterns in tag_sigs.items():
-                    for pattern in patterns:
-                        if re.search(pattern, gtm_content, re.IGNORECASE):
-                            container_analysis["tags_detected"].append(tag_name)
-                            if tag_name not in analysis["tags"]["by_type"]:
-                                analysis["tags"]["by_type"][tag_name] = {"count": 0, "containers": []}
-                            analysis["tags"]["by_type"][tag_name]["count"] += 1
-                            analysis["tags"]["by_type"][tag_name]["containers"].append(container_id)
-                            break
+                for tag_name in match_tag_signatures(gtm_content):
+                    container_analysis["tags_detected"].append(tag_name)
+                    if tag_name not in analysis["tags"]["by_type"]:
+                        analysis["tags"]["by_type"][tag_name] = {"count": 0, "containers": []}
+                    analysis["tags"]["by_type"][tag_name]["count"] += 1
+                    analysis["tags"]["by_type"][tag_name]["containers"].append(container_id)
                 
                 analysis["tags"]["total_count"] = len(analysis["tags"]["by_type"])
                 
@@ -403,8 +857,10 @@ def ultra_precise_gtm_analysis(html_content):
                     analysis["advanced_features"]["cross_domain_tracking"] = True
                 if re.search(r'user_id|userId', gtm_content):
                     analysis["advanced_features"]["user_id_tracking"] = True
-        except:
-            pass
+        except Exception as e:
+            if _deadline and is_timeout(e):
+                container_analysis["skipped"] = True
+                _deadline.skip("gtm", f"Container {container_id} nicht geladen (Timeout)")
         
         analysis["container_details"][container_id] = container_analysis
     
@@ -441,6 +897,10 @@ def ultra_precise_gtm_analysis(html_content):
     if not analysis["advanced_features"]["server_side_tagging"]:
         analysis["implementation_quality"]["recommendations"].append("💡 Server-Side Tagging (ROI: 400%)")
     
+    if any(d.get("skipped") for d in analysis["container_details"].values()):
+        analysis["partial"] = True
+        raise PartialResult(analysis)
+    
     return analysis
 
 def display_gtm_analysis(gtm_data):
@@ -459,6 +919,8 @@ def display_gtm_analysis(gtm_data):
             with col2:
                 if det.get("accessible"):
                     st.markdown(f'<span class="badge badge-success">✓ {det.get("size_kb")} KB</span>', unsafe_allow_html=True)
+                elif det.get("skipped"):
+                    st.markdown('<span class="badge badge-warning">⏱️ übersprungen</span>', unsafe_allow_html=True)
     
     st.markdown("### 🎯 Quality")
     q = gtm_data["implementation_quality"]
@@ -518,10 +980,199 @@ def display_gtm_analysis(gtm_data):
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+# ==================== BLOCK 2b: SCRIPT SCANNING ====================
+SCRIPT_MAX_BYTES = 512 * 1024          # Limit pro Script-Datei
+SCRIPT_TOTAL_BYTES = 4 * 1024 * 1024   # Limit pro Analyse
+SCRIPT_MAX_WORKERS = 8
+
+# Prozessweite Caches: geteilte Vendor-Bundles werden nur einmal geladen
+_script_url_cache = BoundedCache("script_urls", CACHE_BUDGET_MB * 1024 * 1024 // 8, ttl=3600)  # URL -> {"sha256", "size", "truncated", "tags", "transfer"}
+_script_hash_tags = BoundedCache("script_tags", CACHE_BUDGET_MB * 1024 * 1024 // 8)            # sha256 -> erkannte Tags
+
+def fetch_script_capped(url, max_bytes, deadline=None, session=None):
+    """Lädt ein Script, bricht nach max_bytes ab (Inhalt, gekürzt?, Transfer-Messwerte)"""
+    timeout = deadline.timeout(10) if deadline else 10
+    started = time.perf_counter()
+    with (session or requests).get(url, timeout=timeout, headers={'User-Agent': 'Mozilla/5.0'}, stream=True) as resp:
+        if resp.status_code != 200:
+            return None, False, None
+        
+        chunks = []
+        size = 0
+        truncated = False
+        for chunk in resp.iter_content(chunk_size=16384):
+            if deadline and deadline.remaining() <= 0:
+                raise FutureTimeout()
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                truncated = True
+                break
+        content = b"".join(chunks)[:max_bytes]
+        return content, truncated, transfer_metrics(url, resp, started, len(content), truncated)
+
+def is_first_party(url, base_url):
+    """Prüft, ob eine URL zur analysierten Domain gehört"""
+    host = urlparse(url).netloc.lower().split(':')[0]
+    base_host = urlparse(base_url).netloc.lower().split(':')[0]
+    if base_host.startswith('www.'):
+        base_host = base_host[4:]
+    return host == base_host or host.endswith('.' + base_host)
+
+def scannable_scripts(script_urls):
+    """Script-URLs ohne Duplikate & ohne gtm.js (wird bereits in der Container-Analyse ausgewertet)"""
+    return [u for u in dict.fromkeys(script_urls)
+            if not (re.search(r'googletagmanager\.com/gtm\.js', u) or u.startswith(GTM_JS_URL))]
+
+def scan_scripts(base_url, script_urls, deadline=None, session=None, use_cache=True):
+    """Scannt First- und Third-Party-Scripts auf Tag-Signaturen
+    
+    use_cache=False lädt alle Scripts neu (inkrementell: Inhalt unter
+    gleicher URL geändert) und aktualisiert den URL-Cache.
+    """
+    offline = bool(session and session.offline)  # Replay: URL-Cache kennt nur den Live-Stand
+    
+    result = {
+        "total_count": 0,
+        "scripts": [],
+        "tags": {},
+        "skipped": [],
+        "bytes_downloaded": 0,
+        "cache_hits": 0
+    }
+    
+    urls = scannable_scripts(script_urls)
+    
+    budget = {"remaining": SCRIPT_TOTAL_BYTES}
+    budget_lock = threading.Lock()
+    
+    def scan_one(url):
+        cached = _script_url_cache.get(url) if use_cache and not offline else None
+        if cached:
+            return url, cached, True, None
+        
+        if deadline and deadline.expired():
+            return url, None, False, "Deadline erreicht"
+        
+        with budget_lock:
+            allowance = min(SCRIPT_MAX_BYTES, budget["remaining"])
+            budget["remaining"] -= allowance
+        if allowance <= 0:
+            return url, None, False, "Byte-Budget erschöpft"
+        
+        content = None
+        timed_out = False
+        try:
+            content, truncated, transfer = fetch_script_capped(url, allowance, deadline, session)
+        except (FutureTimeout, requests.exceptions.Timeout):
+            timed_out = bool(deadline)
+        except Exception:
+            pass
+        finally:
+            with budget_lock:
+                budget["remaining"] += allowance - (len(content) if content else 0)
+        
+        if content is None:
+            return url, None, False, "Deadline erreicht" if timed_out else "Nicht erreichbar"
+        
+        sha256 = hashlib.sha256(content).hexdigest()
+        tags = _script_hash_tags.get(sha256)
+        if tags is None:
+            tags = match_tag_signatures(content.decode('utf-8', errors='ignore'))
+            _script_hash_tags.set(sha256, tags)
+        
+        entry = {"sha256": sha256, "size": len(content), "truncated": truncated, "tags": tags, "transfer": transfer}
+        if not offline:
+            _script_url_cache.set(url, entry)
+        return url, entry, False, None
+    
+    if not urls:
+        return result
+    
+    seen_hashes = {}
+    with ThreadPoolExecutor(max_workers=SCRIPT_MAX_WORKERS) as pool:
+        for url, entry, cache_hit, reason in pool.map(scan_one, urls):
+            if entry is None:
+                result["skipped"].append({"url": url, "reason": reason,
+                                          "party": "first" if is_first_party(url, base_url) else "third"})
+                continue
+            
+            if cache_hit:
+                result["cache_hits"] += 1
+            else:
+                result["bytes_downloaded"] += entry["size"]
+            tags = list(entry["tags"])
+            
+            script_info = {
+                "url": url,
+                "party": "first" if is_first_party(url, base_url) else "third",
+                "size_kb": round(entry["size"] / 1024, 2),
+                "truncated": entry["truncated"],
+                "tags_detected": tags,
+                "duplicate_of": seen_hashes.get(entry["sha256"]),
+                "transfer": entry["transfer"],
+                "cached": cache_hit
+            }
+            result["scripts"].append(script_info)
+            
+            # Gleicher Inhalt unter anderer URL nur einmal zählen
+            if script_info["duplicate_of"]:
+                continue
+            seen_hashes[entry["sha256"]] = url
+            
+            for tag_name in tags:
+                if tag_name not in result["tags"]:
+                    result["tags"][tag_name] = {"count": 0, "scripts": []}
+                result["tags"][tag_name]["count"] += 1
+                result["tags"][tag_name]["scripts"].append(url)
+    
+    result["total_count"] = len(result["scripts"])
+    timed_out = sum(1 for s in result["skipped"] if s["reason"] == "Deadline erreicht")
+    if timed_out:
+        result["partial"] = True
+        deadline.skip("scripts", f"{timed_out} Scripts nicht geladen")
+    return result
+
+def display_script_analysis(script_data, gtm_data):
+    """Zeigt Tags aus <script src> Bundles"""
+    
+    st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+    st.markdown('<h2 class="section-header">🧩 Script Scan</h2>', unsafe_allow_html=True)
+    
+    first = sum(1 for s in script_data["scripts"] if s["party"] == "first")
+    third = script_data["total_count"] - first
+    st.markdown(f"**{script_data['total_count']} Scripts** gescannt ({first} First-Party, {third} Third-Party) • "
+                f"{round(script_data['bytes_downloaded'] / 1024, 1)} KB geladen • {script_data['cache_hits']} aus Cache")
+    
+    st.markdown(f"### 🏷️ Tags in Scripts ({len(script_data['tags'])})")
+    for tag, data in script_data["tags"].items():
+        outside = tag not in gtm_data["tags"]["by_type"]
+        badge = '<span class="badge badge-warning">außerhalb GTM</span>' if outside else ''
+        st.markdown(f'<div class="tool-item"><strong>{tag}</strong> <span class="badge badge-info">{data["count"]}x</span> {badge}</div>', unsafe_allow_html=True)
+    
+    with st.expander("Scripts anzeigen"):
+        for script in script_data["scripts"]:
+            tags = ", ".join(script["tags_detected"]) or "–"
+            note = " (gekürzt)" if script["truncated"] else ""
+            st.markdown(f"""
+                <div class="tool-item">
+                    <strong>{script['party'].title()}-Party</strong> {script['size_kb']} KB{note} • {tags}<br>
+                    <small style="opacity: 0.7;">{script['url']}</small>
+                </div>
+            """, unsafe_allow_html=True)
+        for skipped in script_data["skipped"]:
+            st.markdown(f'<span class="badge badge-warning">{skipped["reason"]}</span> <small>{skipped["url"]}</small>', unsafe_allow_html=True)
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
 # ==================== BLOCK 3: COMPANY INTELLIGENCE ====================
-@st.cache_data(ttl=3600)
-def get_company_intelligence_ai(domain, html_content):
-    """Company Intelligence mit AI-Enrichment"""
+@st.cache_data(ttl=3600, max_entries=256)
+def get_company_intelligence_ai(domain, html_content, _deadline=None, _session=None):
+    """Company Intelligence mit AI-Enrichment
+    
+    WHOIS und Gemini laufen mit Timeout; reicht das Budget nicht, wird das
+    Teilergebnis als PartialResult geworfen (wird nicht gecacht).
+    """
     
     company = {
         "name": None,
@@ -595,38 +1246,63 @@ def get_company_intelligence_ai(domain, html_content):
         if match:
             company["social_media"][platform] = match.group(1)
     
+    skipped = []
+    offline = bool(_session and _session.offline)  # Replay: WHOIS & Gemini aus dem Archiv
+    if _session and not offline:
+        _session.requested.update({f"whois:{domain}", f"gemini:{domain}"})  # live abgefragt: kein Revisit
+    
     # Whois
-    if WHOIS_AVAILABLE:
+    creation = None
+    if offline:
+        whois_data = _session.archived(f"whois:{domain}") or {}
+        if whois_data.get("creation_date"):
+            creation = datetime.fromisoformat(whois_data["creation_date"])
+    elif WHOIS_AVAILABLE and _deadline and _deadline.expired():
+        skipped.append("WHOIS")
+    elif WHOIS_AVAILABLE:
         try:
-            w = whois.whois(domain)
+            timeout = _deadline.timeout(8) if _deadline else 8
+            w = call_with_timeout("whois", lambda: whois.whois(domain, ignore_socket_errors=False, timeout=timeout), timeout)
             if hasattr(w, 'creation_date') and w.creation_date:
                 creation = w.creation_date[0] if isinstance(w.creation_date, list) else w.creation_date
-                if creation:
-                    age = (datetime.now() - creation).days / 365.25
-                    company["founded"] = creation.year
-                    
-                    if age > 15:
-                        company["size_estimate"] = "Enterprise (500+ MA)"
-                        company["revenue_estimate"] = ">€50M"
-                    elif age > 10:
-                        company["size_estimate"] = "Mid-Market (100-500 MA)"
-                        company["revenue_estimate"] = "€10-50M"
-                    elif age > 5:
-                        company["size_estimate"] = "SMB (50-100 MA)"
-                        company["revenue_estimate"] = "€2-10M"
-                    elif age > 2:
-                        company["size_estimate"] = "Startup (10-50 MA)"
-                        company["revenue_estimate"] = "€0.5-2M"
-                    else:
-                        company["size_estimate"] = "Early-Stage (<10 MA)"
-                        company["revenue_estimate"] = "<€500k"
+            if _session:
+                _session.store(f"whois:{domain}", {"creation_date": creation.isoformat() if creation else None})
+        except Exception as e:
+            if is_timeout(e):
+                skipped.append("WHOIS")
+    
+    if creation:
+        try:
+            age = (datetime.now() - creation).days / 365.25
+            company["founded"] = creation.year
+            
+            if age > 15:
+                company["size_estimate"] = "Enterprise (500+ MA)"
+                company["revenue_estimate"] = ">€50M"
+            elif age > 10:
+                company["size_estimate"] = "Mid-Market (100-500 MA)"
+                company["revenue_estimate"] = "€10-50M"
+            elif age > 5:
+                company["size_estimate"] = "SMB (50-100 MA)"
+                company["revenue_estimate"] = "€2-10M"
+            elif age > 2:
+                company["size_estimate"] = "Startup (10-50 MA)"
+                company["revenue_estimate"] = "€0.5-2M"
+            else:
+                company["size_estimate"] = "Early-Stage (<10 MA)"
+                company["revenue_estimate"] = "<€500k"
         except:
             pass
     
     # AI-Enrichment via Gemini
-    if GENAI_AVAILABLE and "GEMINI_API_KEY" in st.secrets:
+    ai_text = None
+    if offline:
+        ai_text = (_session.archived(f"gemini:{domain}") or {}).get("text")
+    elif GENAI_AVAILABLE and get_gemini_api_key() and _deadline and _deadline.expired():
+        skipped.append("Gemini")
+    elif GENAI_AVAILABLE and get_gemini_api_key():
         try:
-            genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+            genai.configure(api_key=get_gemini_api_key())
             
             prompt = f"""Analysiere diese Firma basierend auf den Daten:
 
@@ -646,19 +1322,32 @@ Gib eine präzise Einschätzung als JSON:
 Nur JSON zurückgeben, keine Erklärung."""
             
             model = genai.GenerativeModel('gemini-1.5-flash')
-            response = model.generate_content(prompt)
-            
-            try:
-                ai_data = json.loads(response.text.strip().replace('```json', '').replace('```', ''))
-                if ai_data.get("industry_refined"):
-                    company["industry"] = ai_data["industry_refined"]
-                if ai_data.get("headquarters_guess"):
-                    company["headquarters"] = ai_data["headquarters_guess"]
-                company["ai_enriched"] = True
-            except:
-                company["ai_enriched"] = False
+            timeout = _deadline.timeout(15) if _deadline else 15
+            response = call_with_timeout("gemini", model.generate_content, timeout, prompt,
+                                         request_options={"timeout": timeout})
+            ai_text = response.text
+            if _session:
+                _session.store(f"gemini:{domain}", {"text": ai_text})
+        except Exception as e:
+            if is_timeout(e):
+                skipped.append("Gemini")
+    
+    if ai_text is not None:
+        try:
+            ai_data = json.loads(ai_text.strip().replace('```json', '').replace('```', ''))
+            if ai_data.get("industry_refined"):
+                company["industry"] = ai_data["industry_refined"]
+            if ai_data.get("headquarters_guess"):
+                company["headquarters"] = ai_data["headquarters_guess"]
+            company["ai_enriched"] = True
         except:
-            pass
+            company["ai_enriched"] = False
+    
+    if skipped and _deadline:
+        for source in skipped:
+            _deadline.skip("company", f"{source} übersprungen")
+        company["partial"] = True
+        raise PartialResult(company)
     
     return company
 
@@ -694,6 +1383,1170 @@ def display_company_intelligence(company_data):
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+# ==================== BLOCK 4: TOOL DETECTION ====================
+FINGERPRINTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fingerprints.json")
+# Hosts nur aus geladenen Ressourcen (<a href> auf Trustpilot & Co. ist kein eingebundenes Tool)
+RESOURCE_HOST_PATTERN = re.compile(r'(?:<(?:script|iframe|img)\s[^>]*?\bsrc|<link\s[^>]*?\bhref)'
+                                   r'\s*=\s*["\']?\s*(?:https?:)?//([a-z0-9][a-z0-9.-]*\.[a-z]{2,})')
+META_TAG_PATTERN = re.compile(r'<meta\s[^>]*>')
+
+class HostTrie:
+    """Hostname-Trie über umgekehrte Labels (com -> hotjar -> static)"""
+    
+    def __init__(self):
+        self.root = {}
+    
+    def add(self, host, payload):
+        node = self.root
+        for label in reversed(host.split('.')):
+            node = node.setdefault(label, {})
+        node.setdefault('', []).append(payload)
+    
+    def match(self, host):
+        """Alle Einträge für den Host und seine Parent-Domains"""
+        found = []
+        node = self.root
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            found.extend(node.get('', []))
+        return found
+
+class PatternAutomaton:
+    """Kombinierter Pattern-Automat für Literale
+    
+    Alle Patterns werden in einen Zeichen-Trie einsortiert und daraus eine
+    einzige Regex gebaut. Pro Textposition wird nur der Trie-Pfad verfolgt,
+    die Laufzeit hängt also von der Textlänge ab, nicht von der Anzahl der
+    Patterns.
+    """
+    
+    def __init__(self, payloads):
+        self.payloads = payloads  # pattern -> [payload, ...]
+        self._prefixes = {}       # pattern -> alle Patterns, die Präfix davon sind
+        trie = {}
+        for pattern in payloads:
+            node = trie
+            for ch in pattern:
+                node = node.setdefault(ch, {})
+            node[''] = pattern
+        self._collect_prefixes(trie, [])
+        self._regex = re.compile('(?=(' + self._to_regex(trie) + '))') if trie else None
+    
+    def _collect_prefixes(self, node, path):
+        if '' in node:
+            path = path + [node['']]
+            self._prefixes[node['']] = path
+        for ch, child in node.items():
+            if ch:
+                self._collect_prefixes(child, path)
+    
+    def _to_regex(self, node):
+        branches = [re.escape(ch) + self._to_regex(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy: an jeder Position gewinnt das längste Pattern
+        return '(?:' + body + ')?' if '' in node else body
+    
+    def finditer(self, text):
+        """(pattern, start) für jedes Vorkommen eines Patterns im Text"""
+        if self._regex:
+            for match in self._regex.finditer(text):
+                if match.group(1):
+                    for pattern in self._prefixes[match.group(1)]:
+                        yield pattern, match.start()
+    
+    def search(self, text):
+        """Alle Patterns, die irgendwo im Text vorkommen"""
+        return {pattern for pattern, _ in self.finditer(text)}
+    
+    def match_prefixes(self, text):
+        """Alle Patterns, die Präfix des Textes sind"""
+        if not self._regex:
+            return []
+        match = self._regex.match(text)
+        return self._prefixes[match.group(1)] if match and match.group(1) else []
+
+class ToolIndex:
+    """Vorkompilierte Lookup-Indizes für die Fingerprint-Datenbank"""
+    
+    def __init__(self, tools):
+        self.tools = tools
+        self.hosts = HostTrie()
+        content, cookies, meta = {}, {}, {}
+        
+        for idx, tool in enumerate(tools):
+            for host in tool.get("hosts", []):
+                self.hosts.add(host.lower(), idx)
+            for kind in ("globals", "html"):
+                for pattern in tool.get(kind, []):
+                    content.setdefault(pattern.lower(), []).append((idx, kind))
+            for pattern in tool.get("cookies", []):
+                cookies.setdefault(pattern.lower(), []).append(idx)
+            for pattern in tool.get("meta", []):
+                meta.setdefault(pattern.lower(), []).append(idx)
+        
+        self.content = PatternAutomaton(content)
+        self.cookies = PatternAutomaton(cookies)
+        self.meta = PatternAutomaton(meta)
+
+@st.cache_resource
+def load_tool_index():
+    """Fingerprint-Datenbank laden & indizieren (einmal pro Prozess)"""
+    with open(FINGERPRINTS_PATH, encoding='utf-8') as f:
+        return ToolIndex(json.load(f)["tools"])
+
+def extract_meta_pairs(html_lower):
+    """<meta name|property=... content=...> als "name=content" """
+    pairs = []
+    for tag in META_TAG_PATTERN.findall(html_lower):
+        name = re.search(r'(?:name|property|http-equiv)\s*=\s*["\']([^"\']+)', tag)
+        content = re.search(r'content\s*=\s*["\']([^"\']*)', tag)
+        if name and content:
+            pairs.append(f"{name.group(1).strip()}={content.group(1).strip()}")
+    return pairs
+
+IDENTIFIER_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789_$")
+
+def at_token_boundary(text, start, pattern, kind):
+    """Kein Treffer mitten in einem Bezeichner (econda ≠ btn-secondary)
+    
+    Globals brauchen Grenzen auf beiden Seiten, HTML-Patterns nur links,
+    da sie oft Präfixe von Dateinamen sind (ruxitagentjs_...).
+    """
+    if pattern[0] in IDENTIFIER_CHARS and start > 0 and text[start - 1] in IDENTIFIER_CHARS:
+        return False
+    end = start + len(pattern)
+    if kind == "globals" and pattern[-1] in IDENTIFIER_CHARS and end < len(text) and text[end] in IDENTIFIER_CHARS:
+        return False
+    return True
+
+def detect_tools(html_content, script_urls=(), cookies=()):
+    """Tool Detection über Script-Hosts, Cookies, Meta-Tags, Globals & HTML"""
+    started = time.time()
+    index = load_tool_index()
+    html_lower = html_content.lower()
+    evidence = {}
+    
+    def hit(idx, proof):
+        proofs = evidence.setdefault(idx, [])
+        if proof not in proofs and len(proofs) < 5:
+            proofs.append(proof)
+    
+    # Ressourcen-Hosts (Trie): Script-URLs plus src/href eingebundener Ressourcen
+    hosts = set(RESOURCE_HOST_PATTERN.findall(html_lower))
+    hosts.update((urlparse(u).hostname or '') for u in script_urls)
+    for host in hosts:
+        for idx in index.hosts.match(host):
+            hit(idx, f"host: {host}")
+    
+    # Globals & HTML-Patterns (ein Durchlauf)
+    for pattern, start in index.content.finditer(html_lower):
+        for idx, kind in index.content.payloads[pattern]:
+            if at_token_boundary(html_lower, start, pattern, kind):
+                hit(idx, f"{kind}: {pattern}")
+    
+    # Cookies: exakt, oder Präfix bei Patterns mit _ - . am Ende
+    for name in cookies:
+        name = name.lower()
+        for pattern in index.cookies.match_prefixes(name):
+            if pattern == name or pattern[-1] in "_-.":
+                for idx in index.cookies.payloads[pattern]:
+                    hit(idx, f"cookie: {name}")
+    
+    # Meta-Tags
+    for pair in extract_meta_pairs(html_lower):
+        for pattern in index.meta.match_prefixes(pair):
+            for idx in index.meta.payloads[pattern]:
+                hit(idx, f"meta: {pair[:80]}")
+    
+    result = {
+        "total_count": len(evidence),
+        "fingerprint_count": len(index.tools),
+        "by_category": {},
+        "tools": {},
+        "scan_ms": 0
+    }
+    for idx in sorted(evidence, key=lambda i: index.tools[i]["name"].lower()):
+        tool = index.tools[idx]
+        result["tools"][tool["name"]] = {"category": tool["category"], "evidence": evidence[idx]}
+        result["by_category"].setdefault(tool["category"], []).append(tool["name"])
+    result["scan_ms"] = round((time.time() - started) * 1000, 1)
+    return result
+
+def display_tool_detection(tool_data):
+    """Zeigt erkannte Tools nach Kategorie"""
+    
+    st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+    st.markdown('<h2 class="section-header">🧰 Tool Detection</h2>', unsafe_allow_html=True)
+    st.markdown(f"**{tool_data['total_count']} Tools** erkannt • {tool_data['fingerprint_count']} Fingerprints geprüft "
+                f"in {tool_data['scan_ms']} ms")
+    
+    col1, col2 = st.columns(2)
+    for i, (category, tools) in enumerate(sorted(tool_data["by_category"].items())):
+        with col1 if i % 2 == 0 else col2:
+            st.markdown(f"**{category}**")
+            badges = "".join(f'<span class="badge badge-info">{name}</span>' for name in tools)
+            st.markdown(badges, unsafe_allow_html=True)
+    
+    with st.expander("Nachweise anzeigen"):
+        for name, data in tool_data["tools"].items():
+            st.markdown(f"""
+                <div class="tool-item">
+                    <strong>{name}</strong> <small>({data['category']})</small><br>
+                    <small style="opacity: 0.7;">{' • '.join(data['evidence'])}</small>
+                </div>
+            """, unsafe_allow_html=True)
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# ==================== BLOCK 4b: PERFORMANCE IMPACT ====================
+# Gemessen wird beim Laden in Block 2 (gtm.js) und 2b (Scripts): kein zweiter Download
+PERF_SLOW_TTFB_MS = 600
+
+def parse_cache_headers(headers):
+    """Cache-Control, Expires, ETag & Last-Modified auswerten"""
+    cache_control = headers.get('Cache-Control', '').lower()
+    max_age = None
+    match = re.search(r'(?:^|[,\s])max-age\s*=\s*(\d+)', cache_control)
+    if match:
+        max_age = int(match.group(1))
+    elif headers.get('Expires') and headers.get('Date'):
+        try:
+            max_age = max(0, int((parsedate_to_datetime(headers['Expires']) - parsedate_to_datetime(headers['Date'])).total_seconds()))
+        except Exception:
+            max_age = 0
+    
+    validators = bool(headers.get('ETag') or headers.get('Last-Modified'))
+    no_store = 'no-store' in cache_control
+    return {
+        "cache_control": cache_control or None,
+        "max_age": max_age,
+        "etag": bool(headers.get('ETag')),
+        "last_modified": bool(headers.get('Last-Modified')),
+        "cacheable": not no_store and (bool(max_age) or validators)
+    }
+
+def transfer_metrics(url, resp, started, decoded_bytes, truncated=False):
+    """Transfer, Kompression, Cache-Header, TTFB & Redirects eines geladenen Responses
+    
+    Bei gekürzten Downloads gilt Content-Length als Transfergröße; fehlt
+    der Header, sind die Größen nur Untergrenzen (size_exact = False).
+    """
+    wire_bytes = resp.raw.tell()
+    encoding = resp.headers.get('Content-Encoding', '').lower().strip() or "identity"
+    content_length = resp.headers.get('Content-Length', '').strip()
+    size_exact = not truncated or content_length.isdigit()
+    if truncated and size_exact:
+        wire_bytes = int(content_length)
+        if encoding == "identity":
+            decoded_bytes = wire_bytes
+    return {
+        "url": url,
+        "final_url": resp.url,
+        "status": resp.status_code,
+        "wire_bytes": wire_bytes,
+        "decoded_bytes": decoded_bytes,
+        "encoding": encoding,
+        "truncated": truncated,
+        "size_exact": size_exact,
+        "ttfb_ms": round(resp.elapsed.total_seconds() * 1000, 1),
+        "redirect_ms": round(sum(r.elapsed.total_seconds() for r in resp.history) * 1000, 1),
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        "redirects": [{"status": r.status_code, "url": r.url} for r in resp.history],
+        "cache": parse_cache_headers(resp.headers)
+    }
+
+def collect_tracking_resources(gtm_data, script_data):
+    """gtm.js-Container und Third-Party-Scripts mit Tags & Messwerten (oder Grund für fehlende)"""
+    resources = {}
+    for container_id in gtm_data["containers"]:
+        details = gtm_data["container_details"].get(container_id, {})
+        reason = "Deadline erreicht" if details.get("skipped") else "Nicht erreichbar"
+        resources[f"{GTM_JS_URL}?id={container_id}"] = {"kind": "gtm", "label": container_id,
+                                                        "tags": ["Google Tag Manager"],
+                                                        "transfer": details.get("transfer"),
+                                                        "cached": False, "reason": reason}
+    
+    index = load_tool_index()
+    script_data = script_data or {}
+    for script in script_data.get("scripts", []):
+        if script["party"] != "third" or script["url"] in resources:
+            continue
+        tags = list(script["tags_detected"])
+        if not tags:
+            host = urlparse(script["url"]).hostname or ''
+            tags = sorted({index.tools[idx]["name"] for idx in index.hosts.match(host)}) or [host]
+        resources[script["url"]] = {"kind": "script", "label": urlparse(script["url"]).hostname, "tags": tags,
+                                    "transfer": script.get("transfer"), "cached": script.get("cached", False),
+                                    "reason": "Nicht gemessen"}
+    for skipped in script_data.get("skipped", []):
+        if skipped.get("party") == "third" and skipped["url"] not in resources:
+            resources[skipped["url"]] = {"transfer": None, "reason": skipped["reason"]}
+    return resources
+
+def analyze_performance_impact(gtm_data, script_data):
+    """Performance-Last durch Tracking: Tracking-Weight-Score & Aufschlüsselung pro Tag
+    
+    Score 100 = kaum Last; Abzüge für Transfergröße, Requests, Redirects,
+    fehlende Kompression, fehlendes Caching und langsame TTFB. Gekürzte
+    Scripts ohne bekannte Gesamtgröße zählen nur als Untergrenze und
+    gehen nicht in den Größen-Abzug ein.
+    """
+    
+    result = {
+        "score": 100,
+        "grade": "A+",
+        "totals": {"resources": 0, "wire_kb": 0, "decoded_kb": 0, "redirects": 0, "uncompressed": 0,
+                   "not_cacheable": 0, "slow_ttfb": 0, "truncated": 0, "lower_bound": 0},
+        "by_tag": {},
+        "resources": [],
+        "skipped": [],
+        "cache_hits": 0,
+        "issues": []
+    }
+    
+    resources = collect_tracking_resources(gtm_data, script_data)
+    totals = result["totals"]
+    scored_wire_kb = 0
+    for url, meta in resources.items():
+        entry = meta["transfer"]
+        if entry is None:
+            result["skipped"].append({"url": url, "reason": meta["reason"]})
+            continue
+        cache_hit = meta["cached"]
+        wire_kb = entry["wire_bytes"] / 1024
+        decoded_kb = (entry["decoded_bytes"] if entry["decoded_bytes"] is not None else entry["wire_bytes"]) / 1024
+        uncompressed = entry["encoding"] == "identity" and entry["wire_bytes"] > 10 * 1024
+        slow = entry["ttfb_ms"] + entry["redirect_ms"] > PERF_SLOW_TTFB_MS
+        lower_bound = not entry.get("size_exact", not entry["truncated"])
+        
+        result["cache_hits"] += int(cache_hit)
+        result["resources"].append({**entry, "kind": meta["kind"], "label": meta["label"], "tags": meta["tags"],
+                                    "cached": cache_hit})
+        totals["resources"] += 1
+        totals["wire_kb"] += wire_kb
+        totals["decoded_kb"] += decoded_kb
+        totals["redirects"] += len(entry["redirects"])
+        totals["uncompressed"] += int(uncompressed)
+        totals["not_cacheable"] += int(not entry["cache"]["cacheable"])
+        totals["slow_ttfb"] += int(slow)
+        totals["truncated"] += int(entry["truncated"])
+        totals["lower_bound"] += int(lower_bound)
+        if not lower_bound:
+            scored_wire_kb += wire_kb
+        
+        # Kosten gemeinsam genutzter Bundles gleichmäßig auf ihre Tags verteilen
+        share = 1 / len(meta["tags"])
+        for tag in meta["tags"]:
+            tag_data = result["by_tag"].setdefault(tag, {"resources": 0, "wire_kb": 0, "decoded_kb": 0,
+                                                         "max_ttfb_ms": 0, "redirects": 0, "truncated": 0})
+            tag_data["resources"] += 1
+            tag_data["wire_kb"] += wire_kb * share
+            tag_data["decoded_kb"] += decoded_kb * share
+            tag_data["max_ttfb_ms"] = max(tag_data["max_ttfb_ms"], entry["ttfb_ms"])
+            tag_data["redirects"] += len(entry["redirects"])
+            tag_data["truncated"] += int(entry["truncated"])
+    
+    totals["wire_kb"] = round(totals["wire_kb"], 1)
+    totals["decoded_kb"] = round(totals["decoded_kb"], 1)
+    for tag_data in result["by_tag"].values():
+        tag_data["wire_kb"] = round(tag_data["wire_kb"], 1)
+        tag_data["decoded_kb"] = round(tag_data["decoded_kb"], 1)
+    result["by_tag"] = dict(sorted(result["by_tag"].items(), key=lambda item: -item[1]["wire_kb"]))
+    result["resources"].sort(key=lambda r: -r["wire_bytes"])
+    
+    # Tracking Weight Score
+    penalty = min(40, scored_wire_kb / 10)
+    penalty += min(15, 2 * max(0, totals["resources"] - 3))
+    penalty += min(15, 5 * totals["redirects"])
+    penalty += min(10, 5 * totals["uncompressed"])
+    penalty += min(10, 5 * totals["not_cacheable"])
+    penalty += min(10, 5 * totals["slow_ttfb"])
+    score = max(0, round(100 - penalty))
+    result["score"] = score
+    
+    if score >= 90: result["grade"] = "A+"
+    elif score >= 80: result["grade"] = "A"
+    elif score >= 70: result["grade"] = "B"
+    elif score >= 60: result["grade"] = "C"
+    elif score >= 50: result["grade"] = "D"
+    else: result["grade"] = "F"
+    
+    if totals["wire_kb"] > 200:
+        at_least = "mindestens " if totals["lower_bound"] else ""
+        result["issues"].append(f"⚠️ {at_least}{totals['wire_kb']} KB Tracking-Code pro Seitenaufruf")
+    if totals["redirects"]:
+        result["issues"].append(f"⚠️ {totals['redirects']} Redirects vor Tracking-Scripts")
+    if totals["uncompressed"]:
+        result["issues"].append(f"⚠️ {totals['uncompressed']} Scripts ohne Kompression (gzip/br)")
+    if totals["not_cacheable"]:
+        result["issues"].append(f"⚠️ {totals['not_cacheable']} Scripts nicht cachebar")
+    if totals["slow_ttfb"]:
+        result["issues"].append(f"⚠️ {totals['slow_ttfb']} Scripts mit TTFB > {PERF_SLOW_TTFB_MS} ms")
+    
+    # Die Deadline hat bereits die ladende Stufe (GTM/Scripts) gemeldet
+    if any(s["reason"] == "Deadline erreicht" for s in result["skipped"]):
+        result["partial"] = True
+    return result
+
+def display_performance_impact(perf_data):
+    """Zeigt Tracking Weight & Kosten pro Tag"""
+    
+    st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+    st.markdown('<h2 class="section-header">⚖️ Performance Impact</h2>', unsafe_allow_html=True)
+    
+    totals = perf_data["totals"]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.markdown(f'<div class="metric-modern"><h2>{perf_data["score"]}</h2><p>Tracking Weight</p></div>', unsafe_allow_html=True)
+    with col2:
+        st.markdown(f'<div class="metric-modern"><h2>{perf_data["grade"]}</h2><p>Grade</p></div>', unsafe_allow_html=True)
+    with col3:
+        st.markdown(f'<div class="metric-modern"><h2>{totals["wire_kb"]}</h2><p>KB Transfer</p></div>', unsafe_allow_html=True)
+    with col4:
+        st.markdown(f'<div class="metric-modern"><h2>{totals["resources"]}</h2><p>Requests</p></div>', unsafe_allow_html=True)
+    
+    st.markdown(f"{totals['decoded_kb']} KB entpackt • {totals['redirects']} Redirects • {perf_data['cache_hits']} aus Cache")
+    if totals.get("lower_bound"):
+        st.caption(f"{totals['lower_bound']} gekürzte Scripts ohne Content-Length: Transfer ist eine Untergrenze "
+                   f"und fließt nicht in den Score ein")
+    
+    if perf_data["by_tag"]:
+        st.markdown("### 🏷️ Kosten pro Tag")
+        table = pd.DataFrame([{"Tag": tag, **data} for tag, data in perf_data["by_tag"].items()])
+        st.dataframe(table, hide_index=True, use_container_width=True)
+    
+    for issue in perf_data["issues"]:
+        st.markdown(f'<div class="recommendation-card">{issue}</div>', unsafe_allow_html=True)
+    
+    with st.expander("Ressourcen anzeigen"):
+        for res in perf_data["resources"]:
+            max_age = res["cache"]["max_age"]
+            cache = f"max-age {max_age}s" if max_age else ("Validator" if res["cache"]["cacheable"] else "kein Cache")
+            hops = f" • {len(res['redirects'])} Redirects" if res["redirects"] else ""
+            size = f"{round(res['wire_bytes'] / 1024, 1)} KB"
+            if res["truncated"]:
+                size = f"{size} (gekürzt)" if res.get("size_exact") else f"≥ {size} (gekürzt)"
+            st.markdown(f"""
+                <div class="tool-item">
+                    <strong>{res['label']}</strong> {size} ({res['encoding']}) •
+                    TTFB {res['ttfb_ms']} ms • {cache}{hops}<br>
+                    <small style="opacity: 0.7;">{res['url']}</small>
+                </div>
+            """, unsafe_allow_html=True)
+        for skipped in perf_data["skipped"]:
+            st.markdown(f'<span class="badge badge-warning">{skipped["reason"]}</span> <small>{skipped["url"]}</small>', unsafe_allow_html=True)
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# ==================== SNAPSHOT ARCHIVE ====================
+ARCHIVE_DIR = os.environ.get("MARTECH_ARCHIVE", "snapshots")  # leer = Archiv aus
+ARCHIVE_MAX_BYTES = 8 * 1024 * 1024  # Body-Limit pro Record (der Live-Response bleibt ungekürzt)
+REPLAY_DEADLINE_SECONDS = 600        # offline: CPU-gebunden, kein Netz-Timeout nötig
+REVISIT_NOT_MODIFIED = "http://netpreserve.org/warc/1.1/revisit/server-not-modified"
+REVISIT_CACHED = "urn:martech:revisit:process-cache"  # Cache-Treffer/übernommene Stufe ohne Request
+
+_archive_lock = threading.Lock()
+
+def write_warc_record(f, warc_type, uri, timestamp, block, content_type, extra=None):
+    """Hängt einen WARC/1.1-Record als eigenes gzip-Member an (Offset & Länge zurück)"""
+    fields = {
+        "WARC-Type": warc_type,
+        "WARC-Record-ID": f"<urn:uuid:{uuid.uuid4()}>",
+        "WARC-Date": timestamp,
+        "WARC-Target-URI": uri,
+        "Content-Type": content_type,
+        **(extra or {}),
+        "Content-Length": str(len(block))
+    }
+    head = "WARC/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in fields.items()) + "\r\n"
+    data = gzip.compress(head.encode('utf-8') + block + b"\r\n\r\n")
+    offset = f.tell()
+    f.write(data)
+    return offset, len(data)
+
+def read_warc_record(file_name, offset, length):
+    with open(os.path.join(ARCHIVE_DIR, file_name), 'rb') as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length))
+    head, _, rest = data.partition(b"\r\n\r\n")
+    fields = dict(line.split(": ", 1) for line in head.decode('utf-8').split("\r\n")[1:])
+    return {"fields": fields, "block": rest[:int(fields["Content-Length"])]}
+
+def http_block(status, reason, headers, body):
+    lines = "".join(f"{k}: {v}\r\n" for k, v in headers)
+    return f"HTTP/1.1 {status} {reason or ''}\r\n{lines}\r\n".encode('latin-1', errors='replace') + body
+
+def parse_http_block(block):
+    """Status, Header (HTTPMessage) & Roh-Body eines archivierten Response"""
+    fp = io.BytesIO(block)
+    status_line = fp.readline().decode('latin-1').split(" ", 2)
+    message = http.client.parse_headers(fp)
+    return int(status_line[1]), status_line[2].strip() if len(status_line) > 2 else "", message, fp.read()
+
+def restore_elapsed(resp, *args, **kwargs):
+    """Replay: resp.elapsed = archivierte TTFB statt der Zeit bis zum Archiv-Lookup"""
+    if hasattr(resp, "archived_elapsed"):
+        resp.elapsed = timedelta(seconds=resp.archived_elapsed)
+    return resp
+
+class ArchiveTee:
+    """Ersetzt den Socket-Stream (raw._fp) eines Live-Response
+    
+    Der Aufrufer liest wie ohne Archiv (Streaming, Byte-Limits, Deadline);
+    jedes gelesene Roh-Byte landet zusätzlich im Record. Geschrieben wird
+    am Body-Ende, beim Schließen oder spätestens beim Flush der Session.
+    Ohne fp-Attribut liest urllib3 Chunked-Bodies über read(). Hängt an
+    urllib3-Interna: unterstützte Versionen stehen in requirements.txt.
+    """
+    
+    def __init__(self, fp, on_done):
+        self._fp = fp
+        self._on_done = on_done
+        self.body = bytearray()
+        self.overflow = False
+        self.done = False
+    
+    def _tee(self, data):
+        if not self.done:
+            room = ARCHIVE_MAX_BYTES - len(self.body)
+            self.overflow = self.overflow or len(data) > room
+            self.body += data[:max(0, room)]
+            if not data or self._fp.isclosed():
+                self.finish(complete=True)
+        return data
+    
+    def read(self, amt=None):
+        return self._tee(self._fp.read(amt) if amt is not None else self._fp.read())
+    
+    def read1(self, amt=-1):
+        return self._tee(self._fp.read1(amt))
+    
+    def isclosed(self):
+        return self._fp.isclosed()
+    
+    @property
+    def closed(self):
+        return self._fp.closed
+    
+    def flush(self):
+        self._fp.flush()
+    
+    def close(self):
+        self._fp.close()
+        self.finish(complete=False)
+    
+    def finish(self, complete=False):
+        if not self.done:
+            self.done = True
+            self._on_done(bytes(self.body), "length" if self.overflow else (None if complete else "unspecified"))
+            self.body = None
+
+class ArchivingAdapter(HTTPAdapter):
+    """Leitet Requests ans Netz weiter und legt den Roh-Response im Capture ab"""
+    
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+    
+    def send(self, request, stream=False, **kwargs):
+        self.session.requested.add(request.url)
+        # Immer gestreamt: Session.send liest bei stream=False selbst (durch den Tee)
+        started = time.perf_counter()
+        resp = super().send(request, stream=True, **kwargs)
+        ttfb = time.perf_counter() - started
+        headers = list(resp.raw.headers.items())
+        status, reason = resp.status_code, resp.reason
+        if status == 304:  # Kein Inhalt: das Replay folgt dem Revisit zum letzten vollen Stand
+            self.session.add_record("revisit", request.url, status, http_block(status, reason, headers, b""),
+                                    "application/http; msgtype=response", {"WARC-Profile": REVISIT_NOT_MODIFIED})
+            return resp
+        
+        def record(body, truncated):
+            extra = {"WARC-Elapsed-Ms": str(round(ttfb * 1000, 1))}
+            if truncated:
+                extra["WARC-Truncated"] = truncated
+            self.session.add_record("response", request.url, status, http_block(status, reason, headers, body),
+                                    "application/http; msgtype=response", extra)
+        
+        if resp.raw._fp is not None:
+            tee = ArchiveTee(resp.raw._fp, record)
+            resp.raw._fp = tee
+            self.session.track(tee)
+        else:
+            record(b"", None)
+        return resp
+
+class ReplayAdapter(HTTPAdapter):
+    """Beantwortet Requests ausschließlich aus dem Archiv (kein Netz)"""
+    
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+    
+    def send(self, request, stream=False, **kwargs):
+        record = self.session.lookup(request.url)
+        if record is None:
+            raise requests.exceptions.ConnectionError(f"Nicht im Archiv: {request.url}", request=request)
+        
+        status, reason, message, body = parse_http_block(record["block"])
+        raw = urllib3.HTTPResponse(body=io.BytesIO(body), headers=list(message.items()), status=status, reason=reason,
+                                   preload_content=False, decode_content=True, enforce_content_length=False,
+                                   request_method=request.method)
+        resp = self.build_response(request, raw)
+        extract_cookies_to_jar(resp.cookies, request, SimpleNamespace(_original_response=SimpleNamespace(msg=message)))
+        resp.archived_elapsed = float(record["fields"].get("WARC-Elapsed-Ms", 0)) / 1000
+        return resp
+
+class ArchiveSession(requests.Session):
+    """HTTP-Session einer Analyse
+    
+    Live schreibt sie alle Responses (Seiten, gtm.js, Scripts) plus WHOIS-
+    und Gemini-Antworten als Capture ins Snapshot-Archiv; mit replay_of
+    (Zeile aus list_snapshots) spielt sie ein Capture offline ab.
+    """
+    
+    def __init__(self, url, replay_of=None):
+        super().__init__()
+        self.url = url
+        self.domain = urlparse(url).netloc
+        self.offline = replay_of is not None
+        self.records = []
+        self.requested = set()  # live abgefragte URIs (auch ohne Antwort)
+        self.tees = []
+        self.record_lock = threading.Lock()
+        self.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))  # wie requests.get: keine Cookies mitsenden
+        
+        if self.offline:
+            self.capture_id = replay_of["capture_id"]
+            self.timestamp = replay_of["timestamp"]
+            self.capture_records = load_capture_records(self.capture_id)
+            adapter = ReplayAdapter(self)
+        else:
+            self.capture_id = uuid.uuid4().hex
+            self.timestamp = datetime.now().isoformat()
+            adapter = ArchivingAdapter(self)
+        
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.hooks["response"].append(restore_elapsed)
+    
+    def add_record(self, warc_type, uri, status, block, content_type, extra=None):
+        with self.record_lock:
+            if any(r[1] == uri for r in self.records):
+                return  # pro Capture nur der erste Abruf einer URL
+            self.records.append((warc_type, uri, status, block, content_type, extra))
+    
+    def track(self, tee):
+        with self.record_lock:
+            self.tees = [t for t in self.tees if not t.done] + [tee]
+    
+    def store(self, uri, data):
+        """Nicht-HTTP-Antwort (WHOIS, Gemini) als metadata-Record ablegen"""
+        if not self.offline:
+            self.add_record("metadata", uri, None, json.dumps(data).encode('utf-8'), "application/json")
+    
+    def revisit(self, uri):
+        """Ohne eigenen Abruf genutzter Stand (Cache-Treffer, übernommene Stufe)
+        als Revisit-Record vermerken; das Replay folgt nur solchen Verweisen"""
+        if not self.offline and uri not in self.requested:
+            self.add_record("revisit", uri, None, b"", "application/http; msgtype=response",
+                            {"WARC-Profile": REVISIT_CACHED})
+    
+    def archived(self, uri):
+        """Offline: Nicht-HTTP-Antwort aus dem Archiv (None, wenn nicht vorhanden)"""
+        record = self.lookup(uri)
+        return json.loads(record["block"]) if record else None
+    
+    def lookup(self, uri):
+        """Record dieses Captures (None, wenn die URL nicht abgerufen wurde)
+        
+        Revisit-Records (304, Cache-Treffer) verweisen auf den letzten
+        vollständigen Stand derselben URL aus einem älteren Capture.
+        """
+        location = self.capture_records.get(uri)
+        record = read_warc_record(*location) if location else None
+        if record and record["fields"]["WARC-Type"] == "revisit":
+            location = find_archived_record(uri, self.timestamp)
+            record = read_warc_record(*location) if location else None
+        return record
+    
+    def flush(self, analysis_id):
+        """Capture anhängen & indizieren (eine Archivdatei pro Prozess und Tag)
+        
+        304-Antworten und Cache-Treffer liegen als Revisit-Records vor; das
+        Replay löst sie gegen die letzten älteren Stände auf.
+        """
+        if self.offline:
+            return
+        for tee in self.tees:
+            tee.finish()  # Nie ganz gelesene Responses mit dem gelesenen Teil ablegen
+        self.tees = []
+        file_name = f"martech-{datetime.now():%Y%m%d}-{os.getpid()}.warc.gz"
+        warc_date = datetime.fromisoformat(self.timestamp).astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        index_rows = []
+        if self.records:
+            os.makedirs(ARCHIVE_DIR, exist_ok=True)
+            with _archive_lock:
+                with open(os.path.join(ARCHIVE_DIR, file_name), 'ab') as f:
+                    for warc_type, uri, status, block, content_type, extra in self.records:
+                        offset, length = write_warc_record(f, warc_type, uri, warc_date, block, content_type, extra)
+                        index_rows.append((self.capture_id, uri, warc_type, status, self.timestamp, file_name, offset, length))
+        
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        c = conn.cursor()
+        c.executemany('''INSERT INTO snapshot_records
+                         (capture_id, url, record_type, status, timestamp, file, offset, length)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', index_rows)
+        c.execute('INSERT INTO snapshots (capture_id, domain, url, timestamp, analysis_id, records, bytes) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  (self.capture_id, self.domain, self.url, self.timestamp, analysis_id, len(index_rows),
+                   sum(row[7] for row in index_rows)))
+        conn.commit()
+        conn.close()
+        self.records = []
+
+def start_capture(url):
+    """Live-Session, die ins Archiv schreibt (None, wenn MARTECH_ARCHIVE leer ist)"""
+    return ArchiveSession(url) if ARCHIVE_DIR else None
+
+def load_capture_records(capture_id):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('SELECT url, file, offset, length FROM snapshot_records WHERE capture_id = ? ORDER BY id', (capture_id,))
+    records = {}
+    for url, file_name, offset, length in c.fetchall():
+        records.setdefault(url, (file_name, offset, length))
+    conn.close()
+    return records
+
+def find_archived_record(uri, timestamp):
+    """Letzter vollständiger Stand einer URL bis timestamp (Revisits ausgenommen)"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('''SELECT file, offset, length FROM snapshot_records
+                 WHERE url = ? AND timestamp <= ? AND record_type != 'revisit'
+                 ORDER BY timestamp DESC LIMIT 1''', (uri, timestamp))
+    row = c.fetchone()
+    conn.close()
+    return row
+
+def list_snapshots(domain=None, since=None, until=None):
+    """Captures nach Domain & Zeitraum (ISO-Zeitstempel), älteste zuerst"""
+    query = 'SELECT capture_id, domain, url, timestamp, analysis_id, records, bytes FROM snapshots WHERE 1 = 1'
+    params = []
+    if domain:
+        query += ' AND domain = ?'
+        params.append(domain)
+    if since:
+        query += ' AND timestamp >= ?'
+        params.append(since)
+    if until:
+        query += ' AND timestamp <= ?'
+        params.append(until)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    df = pd.read_sql_query(query + ' ORDER BY timestamp', conn, params=params)
+    conn.close()
+    return df
+
+def stage_uris(stage, data, domain):
+    """URIs, die eine Stufe abruft (für Revisits bei Cache-Treffern & übernommenen Stufen)"""
+    if stage == "gtm":
+        return [f"{GTM_JS_URL}?id={container_id}" for container_id, details in data["container_details"].items()
+                if not details.get("skipped")]
+    if stage == "scripts":
+        return [script["url"] for script in data["scripts"]]
+    if stage == "company":
+        return [f"whois:{domain}", f"gemini:{domain}"]
+    return []
+
+def replay_snapshot(snapshot, max_pages=7):
+    """Spielt ein Capture offline durch die Pipeline (ohne Speichern)"""
+    session = ArchiveSession(snapshot["url"], replay_of=snapshot)
+    try:
+        return run_pipeline(snapshot["url"], max_pages, Deadline(REPLAY_DEADLINE_SECONDS), session)
+    finally:
+        session.close()
+
+# ==================== PIPELINE ====================
+def run_pipeline(url, max_pages, deadline, session=None, report=None, page_cache=None, reuse=None):
+    """Alle Stufen einer Analyse ohne Speichern (live oder als Archiv-Replay)
+    
+    Gibt raw_data zurück oder None, wenn der Crawl scheitert. reuse(stage,
+    crawl_data, deadline) kann nach dem Crawl das vorherige Ergebnis einer
+    Stufe liefern (inkrementelle Re-Analyse), None = Stufe läuft. Offline
+    und inkrementell werden die prozessweiten Ergebnis-Caches umgangen: sie
+    kennen weder den Archiv-Stand noch geänderte gtm.js bzw. Scripts bei
+    gleichem HTML.
+    """
+    report = report or (lambda pct: None)
+    bypass_cache = bool(session and session.offline) or reuse is not None
+    reuse = reuse or (lambda stage, crawl_data, deadline: None)
+    gtm_stage = ultra_precise_gtm_analysis.__wrapped__ if bypass_cache else ultra_precise_gtm_analysis
+    company_stage = get_company_intelligence_ai.__wrapped__ if bypass_cache else get_company_intelligence_ai
+    
+    # Crawling
+    report(20)
+    crawl_data = crawl_multiple_pages(url, max_pages, page_cache=page_cache, deadline=deadline, session=session)
+    if not crawl_data:
+        return None
+    report(40)
+    
+    # GTM Analyse
+    gtm_data = (reuse("gtm", crawl_data, deadline)
+                or run_stage(gtm_stage, crawl_data['combined_html'], _deadline=deadline, _session=session))
+    report(50)
+    
+    # Script Scan (Tags außerhalb von GTM)
+    script_data = (reuse("scripts", crawl_data, deadline)
+                   or scan_scripts(url, crawl_data.get('scripts', []), deadline=deadline, session=session,
+                                   use_cache=not bypass_cache))
+    report(55)
+    
+    # Performance Impact (gtm.js & Third-Party-Scripts)
+    performance_data = reuse("performance", crawl_data, deadline) or analyze_performance_impact(gtm_data, script_data)
+    report(58)
+    
+    # Tool Detection
+    tool_data = (reuse("tools", crawl_data, deadline)
+                 or detect_tools(crawl_data['combined_html'], crawl_data.get('scripts', []), crawl_data.get('cookies', [])))
+    report(60)
+    
+    # Company Intelligence
+    domain = urlparse(url).netloc
+    company_data = (reuse("company", crawl_data, deadline)
+                    or run_stage(company_stage, domain, crawl_data['combined_html'], _deadline=deadline, _session=session))
+    report(80)
+    
+    # Aus Cache oder Vorlauf übernommene Abrufe als Revisits ins Capture
+    if session:
+        for stage, data in (("gtm", gtm_data), ("scripts", script_data), ("company", company_data)):
+            for uri in stage_uris(stage, data, domain):
+                session.revisit(uri)
+    
+    return {
+        "crawl": crawl_data,
+        "gtm": gtm_data,
+        "scripts": script_data,
+        "tools": tool_data,
+        "performance": performance_data,
+        "company": company_data,
+        "deadline": deadline.report()
+    }
+
+def run_analysis(url, max_pages=7, progress=None, deadline_seconds=ANALYSIS_DEADLINE_SECONDS, incremental=False,
+                 reuse=None):
+    """Komplette Analyse (UI, Monitoring-Worker & Batch nutzen denselben Pfad)
+    
+    Alle Stufen teilen sich ein Zeitbudget von deadline_seconds; was nicht
+    mehr hineinpasst, wird übersprungen und unter "deadline" vermerkt.
+    Alle Responses landen als Capture im Snapshot-Archiv, auch wenn die
+    Analyse abbricht. incremental: Conditional Requests über die
+    gespeicherten Seitenstände; reuse: siehe run_pipeline.
+    """
+    report = progress or (lambda pct: None)
+    deadline = Deadline(deadline_seconds)
+    domain = urlparse(url).netloc
+    session = start_capture(url)
+    analysis_id = None
+    
+    try:
+        page_cache = load_page_states(domain) if incremental else None
+        raw_data = run_pipeline(url, max_pages, deadline, session, report, page_cache, reuse)
+        if not raw_data:
+            return None
+        if incremental:
+            save_page_states(domain, raw_data["crawl"].pop("page_states"))
+        
+        # Speichern
+        if session:
+            raw_data["snapshot"] = session.capture_id
+        overall_score = raw_data["gtm"]["implementation_quality"]["score"]
+        analysis_id = save_analysis(url, domain, overall_score, raw_data)
+        report(100)
+    finally:
+        if session:
+            session.flush(analysis_id)
+            session.close()
+    
+    return {"id": analysis_id, "url": url, "domain": domain, "overall_score": overall_score, **raw_data}
+
+# ==================== MONITORING ====================
+MONITOR_INTERVALS = {"Stündlich": 60, "Täglich": 1440, "Wöchentlich": 10080}
+
+def add_watch(url, interval_minutes):
+    """Domain auf die Watchlist setzen (letzte Analyse dient als Baseline)"""
+    domain = urlparse(url).netloc
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('''INSERT OR REPLACE INTO watchlist
+                 (domain, url, interval_minutes, enabled, next_run, last_run, last_analysis_id)
+                 VALUES (?, ?, ?, 1, ?, NULL, ?)''',
+              (domain, url, interval_minutes, datetime.now().isoformat(), get_latest_analysis_id(domain)))
+    conn.commit()
+    conn.close()
+
+def remove_watch(domain):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('DELETE FROM watchlist WHERE domain = ?', (domain,))
+    conn.commit()
+    conn.close()
+
+def list_watches():
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    df = pd.read_sql_query('SELECT domain, url, interval_minutes, next_run, last_run, last_analysis_id FROM watchlist ORDER BY domain', conn)
+    conn.close()
+    return df
+
+def list_changes(limit=50):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    df = pd.read_sql_query('SELECT domain, timestamp, alert, stages_run, diff FROM analysis_changes ORDER BY id DESC LIMIT ?',
+                           conn, params=(limit,))
+    conn.close()
+    return df
+
+def load_page_states(domain):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('SELECT url, etag, last_modified, content_hash, body FROM page_state WHERE domain = ?', (domain,))
+    states = {
+        row[0]: {"etag": row[1], "last_modified": row[2], "content_hash": row[3],
+                 "body": zlib.decompress(row[4]).decode('utf-8')}
+        for row in c.fetchall()
+    }
+    conn.close()
+    return states
+
+def save_page_states(domain, page_states):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    now = datetime.now().isoformat()
+    for url, page in page_states.items():
+        c.execute('INSERT OR REPLACE INTO page_state VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  (url, domain, page.get("etag"), page.get("last_modified"), page["content_hash"],
+                   zlib.compress(page["body"].encode('utf-8')), now))
+    conn.commit()
+    conn.close()
+
+def check_resource_changes(table, key_column, label, resources, deadline=None, max_bytes=None):
+    """Conditional Requests & Hash-Vergleich gegen den gespeicherten Stand
+    
+    resources: Key -> URL; table speichert pro Key ETag, Last-Modified und
+    Hash (der ersten max_bytes). Liefert die geänderten Keys; nicht mehr
+    geprüfte (Deadline) oder nicht ladbare Ressourcen gelten als geändert.
+    """
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    changed = []
+    
+    for key, url in resources.items():
+        c.execute(f'SELECT etag, last_modified, content_hash FROM {table} WHERE {key_column} = ?', (key,))
+        row = c.fetchone()
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        if row and row[0]:
+            headers['If-None-Match'] = row[0]
+        if row and row[1]:
+            headers['If-Modified-Since'] = row[1]
+        
+        if deadline and deadline.expired():
+            deadline.skip("monitor", f"{label} {key} nicht geprüft")
+            changed.append(key)
+            continue
+        try:
+            with requests.get(url, timeout=deadline.timeout(10) if deadline else 10, headers=headers, stream=True) as resp:
+                body = resp.raw.read(max_bytes, decode_content=True) if resp.status_code == 200 else None
+        except Exception:
+            changed.append(key)
+            continue
+        
+        if resp.status_code == 304 and row:
+            continue
+        content_hash = hashlib.sha256(body).hexdigest() if body is not None else None
+        if not row or row[2] != content_hash:
+            changed.append(key)
+        c.execute(f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?)',
+                  (key, resp.headers.get('ETag'), resp.headers.get('Last-Modified'),
+                   content_hash, datetime.now().isoformat()))
+    
+    conn.commit()
+    conn.close()
+    return changed
+
+def check_container_changes(container_ids, deadline=None):
+    """Conditional Requests auf gtm.js; liefert die geänderten Container"""
+    return check_resource_changes("container_state", "container_id", "Container",
+                                  {cid: f"{GTM_JS_URL}?id={cid}" for cid in container_ids}, deadline)
+
+def check_script_changes(script_urls, deadline=None):
+    """Conditional Requests auf die Scripts (gleiche URL, neuer Inhalt?); liefert die geänderten URLs"""
+    return check_resource_changes("script_state", "url", "Script", {u: u for u in scannable_scripts(script_urls)},
+                                  deadline, SCRIPT_MAX_BYTES)
+
+def collect_tags(analysis):
+    """Alle erkannten Tags (GTM-Container + Script Scan)"""
+    tags = set(analysis["gtm"]["tags"]["by_type"])
+    tags.update((analysis.get("scripts") or {}).get("tags", {}))
+    return tags
+
+def diff_analyses(previous, current):
+    """Änderungen zwischen zwei Analysen"""
+    prev_containers = set(previous["gtm"]["containers"])
+    curr_containers = set(current["gtm"]["containers"])
+    prev_tags = collect_tags(previous)
+    curr_tags = collect_tags(current)
+    prev_tools = set((previous.get("tools") or {}).get("tools", {}))
+    curr_tools = set((current.get("tools") or {}).get("tools", {}))
+    score_before = previous["gtm"]["implementation_quality"]["score"]
+    score_after = current["gtm"]["implementation_quality"]["score"]
+    
+    diff = {
+        "containers_added": sorted(curr_containers - prev_containers),
+        "containers_removed": sorted(prev_containers - curr_containers),
+        "tags_added": sorted(curr_tags - prev_tags),
+        "tags_lost": sorted(prev_tags - curr_tags),
+        "tools_added": sorted(curr_tools - prev_tools) if prev_tools else [],
+        "tools_lost": sorted(prev_tools - curr_tools),
+        "score_before": score_before,
+        "score_after": score_after,
+        "score_change": score_after - score_before
+    }
+    diff["alert"] = bool(diff["containers_removed"] or diff["tags_lost"] or diff["score_change"] < 0)
+    return diff
+
+def run_incremental_analysis(url, previous=None, deadline_seconds=ANALYSIS_DEADLINE_SECONDS):
+    """Re-Analyse, die nur Stufen mit geänderten Inputs neu ausführt"""
+    stages_run = ["crawl"]
+    changes = {}
+    
+    def reuse(stage, crawl_data, deadline):
+        """Vorheriges Ergebnis der Stufe, solange ihre Inputs unverändert sind"""
+        if not changes:
+            # Auch im ersten Lauf prüfen: legt den Stand aktueller Container & Scripts an
+            containers = set(re.findall(r'GTM-[A-Z0-9]{4,10}', crawl_data["combined_html"]))
+            if previous:
+                containers.update(previous["gtm"]["containers"])
+            changes["containers"] = check_container_changes(sorted(containers), deadline)
+            changes["scripts"] = check_script_changes(crawl_data["scripts"], deadline)
+            changes["pages"] = True
+            if previous:
+                prev_urls = sorted(p["url"] for p in previous["crawl"]["pages"])
+                changes["pages"] = bool(crawl_data["changed_pages"]) or prev_urls != sorted(p["url"] for p in crawl_data["pages"])
+        
+        if previous and stage in previous and not previous[stage].get("partial"):
+            changed = {
+                "gtm": changes["pages"] or bool(changes["containers"]),   # HTML oder gtm.js
+                "scripts": crawl_data["scripts"] != previous["crawl"].get("scripts") or bool(changes["scripts"]),
+                "performance": "gtm" in stages_run or "scripts" in stages_run,
+                "tools": changes["pages"],
+                "company": changes["pages"]
+            }[stage]
+            if not changed:
+                return previous[stage]
+        stages_run.append(stage)
+        return None
+    
+    result = run_analysis(url, 7, deadline_seconds=deadline_seconds, incremental=True, reuse=reuse)
+    return result, stages_run if result else []
+
+def save_change(domain, analysis_id, previous_analysis_id, stages_run, diff):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    c.execute('''INSERT INTO analysis_changes
+                 (domain, timestamp, analysis_id, previous_analysis_id, alert, stages_run, diff)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+              (domain, datetime.now().isoformat(), analysis_id, previous_analysis_id,
+               int(diff.get("alert", False)), ",".join(stages_run), json.dumps(diff)))
+    conn.commit()
+    conn.close()
+
+def claim_due_watches():
+    """Fällige Watches holen und next_run vorziehen (verhindert Doppelläufe)"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = conn.cursor()
+    now = datetime.now()
+    c.execute('SELECT domain, url, interval_minutes, last_analysis_id, next_run FROM watchlist WHERE enabled = 1 AND next_run <= ?',
+              (now.isoformat(),))
+    claimed = []
+    for domain, url, interval, last_id, next_run in c.fetchall():
+        new_next = (now + timedelta(minutes=interval)).isoformat()
+        c.execute('UPDATE watchlist SET next_run = ? WHERE domain = ? AND next_run = ?', (new_next, domain, next_run))
+        if c.rowcount:
+            claimed.append({"domain": domain, "url": url, "last_analysis_id": last_id})
+    conn.commit()
+    conn.close()
+    return claimed
+
+def run_due_watches():
+    """Ein Scheduler-Durchlauf: alle fälligen Domains inkrementell prüfen"""
+    results = []
+    for watch in claim_due_watches():
+        previous = load_analysis(watch["last_analysis_id"]) if watch["last_analysis_id"] else None
+        try:
+            current, stages_run = run_incremental_analysis(watch["url"], previous)
+        except Exception as e:
+            save_change(watch["domain"], None, watch["last_analysis_id"], [], {"error": str(e), "alert": True})
+            continue
+        
+        if current is None:
+            diff = {"error": "Crawl fehlgeschlagen", "alert": True}
+            save_change(watch["domain"], None, watch["last_analysis_id"], [], diff)
+            continue
+        
+        diff = diff_analyses(previous, current) if previous else {"baseline": True, "alert": False}
+        save_change(watch["domain"], current["id"], watch["last_analysis_id"], stages_run, diff)
+        
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        c = conn.cursor()
+        c.execute('UPDATE watchlist SET last_run = ?, last_analysis_id = ? WHERE domain = ?',
+                  (datetime.now().isoformat(), current["id"], watch["domain"]))
+        conn.commit()
+        conn.close()
+        results.append({"domain": watch["domain"], "stages_run": stages_run, "diff": diff})
+    return results
+
+def display_monitoring():
+    """Watchlist & Änderungsprotokoll"""
+    
+    st.markdown('<div class="glass-card">', unsafe_allow_html=True)
+    st.markdown('<h2 class="section-header">📡 Monitoring</h2>', unsafe_allow_html=True)
+    
+    watches = list_watches()
+    if watches.empty:
+        st.markdown("Keine Domains auf der Watchlist.")
+    else:
+        st.dataframe(watches, use_container_width=True, hide_index=True)
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            domain = st.selectbox("Domain", watches["domain"].tolist(), label_visibility="collapsed")
+        with col2:
+            if st.button("🗑️ Entfernen"):
+                remove_watch(domain)
+                st.rerun()
+    
+    changes = list_changes()
+    if not changes.empty:
+        st.markdown("### 🔔 Änderungen")
+        for _, change in changes.iterrows():
+            diff = json.loads(change["diff"])
+            css = "recommendation-card" if change["alert"] else "recommendation-card info"
+            parts = []
+            if diff.get("error"): parts.append(f"❌ {diff['error']}")
+            if diff.get("baseline"): parts.append("Baseline erstellt")
+            if diff.get("containers_removed"): parts.append(f"Container entfernt: {', '.join(diff['containers_removed'])}")
+            if diff.get("containers_added"): parts.append(f"Container neu: {', '.join(diff['containers_added'])}")
+            if diff.get("tags_lost"): parts.append(f"Tags verloren: {', '.join(diff['tags_lost'])}")
+            if diff.get("tags_added"): parts.append(f"Tags neu: {', '.join(diff['tags_added'])}")
+            if diff.get("tools_lost"): parts.append(f"Tools entfernt: {', '.join(diff['tools_lost'])}")
+            if diff.get("tools_added"): parts.append(f"Tools neu: {', '.join(diff['tools_added'])}")
+            if diff.get("score_change"): parts.append(f"Score {diff['score_before']} → {diff['score_after']}")
+            summary = " • ".join(parts) or "Keine Änderungen"
+            st.markdown(f'<div class="{css}"><strong>{change["domain"]}</strong> <small>{change["timestamp"][:16]}</small><br>{summary}</div>', unsafe_allow_html=True)
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
 # ==================== MAIN UI ====================
 def main():
     init_database()
@@ -713,7 +2566,8 @@ def main():
         ✅ **Block 1:** Multi-Page Crawl  
         ✅ **Block 2:** GTM Deep-Dive  
         ✅ **Block 3:** Company Intelligence  
-        ⏳ **Block 4:** Tool Detection  
+        ✅ **Block 4:** Tool Detection  
+        ✅ **Block 4b:** Performance Impact  
         ⏳ **Block 5:** Recommendations
         """)
         
@@ -725,10 +2579,17 @@ def main():
         else:
             st.error("✗ Whois")
         
-        if GENAI_AVAILABLE and "GEMINI_API_KEY" in st.secrets:
+        if GENAI_AVAILABLE and get_gemini_api_key():
             st.success("✓ Gemini AI")
         else:
             st.warning("⚠ Gemini")
+        
+        st.markdown("---")
+        st.markdown("### 💾 Speicher")
+        memory = get_memory_report()
+        if memory["rss_mb"] is not None:
+            st.markdown(f"**Prozess:** {memory['rss_mb']} MB • **Cache-Budget:** {memory['budget_mb']} MB")
+        st.dataframe(pd.DataFrame(memory["caches"]), hide_index=True, use_container_width=True)
     
     # Input
     col1, col2 = st.columns([3, 1])
@@ -751,36 +2612,12 @@ def main():
         else:
             with st.spinner("🔬 Analysiere..."):
                 prog = st.progress(0)
+                result = run_analysis(url_input, 7, progress=prog.progress)
                 
-                # Crawling
-                prog.progress(20)
-                crawl_data = crawl_multiple_pages(url_input, 7)
-                
-                if crawl_data:
-                    prog.progress(40)
-                    
-                    # GTM Analyse
-                    gtm_data = ultra_precise_gtm_analysis(crawl_data['combined_html'])
-                    prog.progress(60)
-                    
-                    # Company Intelligence
-                    domain = urlparse(url_input).netloc
-                    company_data = get_company_intelligence_ai(domain, crawl_data['combined_html'])
-                    prog.progress(80)
-                    
-                    # Speichern
-                    overall_score = gtm_data["implementation_quality"]["score"]
-                    save_analysis(url_input, domain, overall_score, {
-                        "crawl": crawl_data,
-                        "gtm": gtm_data,
-                        "company": company_data
-                    })
-                    
-                    prog.progress(100)
-                    
-                    st.session_state.crawl_data = crawl_data
-                    st.session_state.gtm_analysis = gtm_data
-                    st.session_state.company_intel = company_data
+                if result:
+                    # Nur Handle + Zusammenfassung in der Session, Daten liegen in der DB
+                    st.session_state.analysis_id = result["id"]
+                    st.session_state.summary = summarize_analysis(result)
                     st.session_state.url = url_input
                     
                     prog.empty()
@@ -788,21 +2625,40 @@ def main():
                     st.rerun()
     
     # Ergebnisse
-    if "crawl_data" in st.session_state:
-        crawl = st.session_state.crawl_data
+    if "analysis_id" in st.session_state:
+        analysis = get_analysis_view(st.session_state.analysis_id)
+        if analysis is None:
+            st.error("❌ Analyse nicht mehr in der Datenbank")
+            st.stop()
+        crawl = analysis["crawl"]
+        summary = st.session_state.summary
         
         st.markdown("---")
+        st.markdown(f"### {summary['domain']} • Score {summary['score']} ({summary['grade']})")
+        
+        if analysis.get("deadline", {}).get("partial"):
+            budget = analysis["deadline"]
+            skipped = "  \n".join(f"• **{s['stage']}:** {s['detail']}" for s in budget["skipped"])
+            st.warning(f"⏱️ Teilergebnis: Zeitbudget von {budget['budget_s']:.0f} s erreicht "
+                       f"({budget['elapsed_s']} s). Übersprungen:  \n{skipped}")
         
         # Crawl Info
         st.markdown('<div class="glass-card">', unsafe_allow_html=True)
         st.markdown(f'<h3 class="section-header">📄 Multi-Page Crawl</h3>', unsafe_allow_html=True)
         st.markdown(f"**{crawl['total_pages']} Seiten** analysiert")
+        if crawl.get("adaptive"):
+            adaptive = crawl["adaptive"]
+            st.markdown(f"Adaptiv: {adaptive['signals']} Signale • Stopp: {adaptive['stop_reason']} "
+                        f"(Budget {adaptive['budget']} Seiten, {adaptive['links_found']} Links gefunden)")
+        if analysis.get("snapshot"):
+            st.markdown(f"📦 Snapshot archiviert: `{analysis['snapshot'][:12]}`")
         
         with st.expander("Seiten anzeigen"):
             for page in crawl['pages']:
+                new = f" • +{page['new_signals']} Signale" if "new_signals" in page else ""
                 st.markdown(f"""
                     <div class="tool-item">
-                        <strong>{page['status']}</strong> {page['title']}<br>
+                        <strong>{page['status']}</strong> {page['title']}{new}<br>
                         <small style="opacity: 0.7;">{page['url']}</small>
                     </div>
                 """, unsafe_allow_html=True)
@@ -810,12 +2666,22 @@ def main():
         st.markdown('</div>', unsafe_allow_html=True)
         
         # Company Intelligence
-        if "company_intel" in st.session_state:
-            display_company_intelligence(st.session_state.company_intel)
+        display_company_intelligence(analysis["company"])
         
         # GTM Analysis
-        if "gtm_analysis" in st.session_state:
-            display_gtm_analysis(st.session_state.gtm_analysis)
+        display_gtm_analysis(analysis["gtm"])
+        
+        # Script Scan
+        if analysis.get("scripts"):
+            display_script_analysis(analysis["scripts"], analysis["gtm"])
+        
+        # Performance Impact
+        if analysis.get("performance"):
+            display_performance_impact(analysis["performance"])
+        
+        # Tool Detection
+        if analysis.get("tools"):
+            display_tool_detection(analysis["tools"])
         
         # Status
         st.markdown("---")
@@ -823,8 +2689,10 @@ def main():
             ✅ **Block 1:** Multi-Page Crawling  
             ✅ **Block 2:** GTM Deep-Dive  
             ✅ **Block 3:** Company Intelligence  
+            ✅ **Block 4:** Tool Detection  
+            ✅ **Block 4b:** Performance Impact  
             
-            **Nächste Schritte:** Block 4 (Complete Tool Detection) & Block 5 (Recommendations) folgen!
+            **Nächste Schritte:** Block 5 (Recommendations) folgt!
         """)
         
         # Export & Reset
@@ -832,11 +2700,7 @@ def main():
         
         with col1:
             if st.button("📥 JSON Export"):
-                data = {
-                    "crawl": st.session_state.crawl_data,
-                    "gtm": st.session_state.gtm_analysis,
-                    "company": st.session_state.company_intel
-                }
+                data = load_analysis(st.session_state.analysis_id)  # inkl. HTML, nicht gecacht
                 st.download_button(
                     "Download",
                     json.dumps(data, indent=2, ensure_ascii=False),
@@ -849,6 +2713,16 @@ def main():
                 for key in list(st.session_state.keys()):
                     del st.session_state[key]
                 st.rerun()
+        
+        with col3:
+            interval = st.selectbox("Intervall", list(MONITOR_INTERVALS), index=1, label_visibility="collapsed")
+            if st.button("👁️ Überwachen"):
+                add_watch(st.session_state.url, MONITOR_INTERVALS[interval])
+                st.success(f"✓ {urlparse(st.session_state.url).netloc} wird überwacht")
+    
+    # Monitoring
+    with st.expander("📡 Monitoring & Alerts"):
+        display_monitoring()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,260 @@
+"""
+MarTech Analyzer Pro v5.0 - Load Test
+Misst, wie viele parallele Analysen eine App-Instanz verkraftet.
+
+- Lokales Stand-in-Web: Mock-Sites mit einstellbarer Latenz, Seitengröße
+  und gtm.js-Containern, dazu Stubs für WHOIS und Gemini
+- Treiber: N parallele Analysen über denselben Pfad wie main()
+  (run_analysis -> summarize_analysis -> get_analysis_view)
+- Report: p50/p95/p99, Durchsatz, Speicher und Fehlerquote je Stufe
+
+Start:
+python loadtest.py --levels 1,2,4,8,16 --requests 20
+python loadtest.py --latency-ms 200 --deadline 5 --json report.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+SUBPAGES = ["about", "products", "services", "pricing", "contact", "company"]
+
+
+# ==================== STAND-IN WEB ====================
+def pad(content, size_kb):
+    """Füllt Inhalt mit Blindtext auf size_kb auf"""
+    filler = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. "
+    missing = size_kb * 1024 - len(content)
+    return content + (filler * (missing // len(filler) + 1))[:max(0, missing)]
+
+def render_page(site, slug, config):
+    links = "".join(f'<a href="/site/{site}/{page}">{page}</a>' for page in SUBPAGES[:config.pages])
+    html = f"""<html><head>
+<title>Site {site} | Online Shop</title>
+<meta name="description" content="Mock-Shop {site} für den Lasttest">
+<meta name="generator" content="WordPress 6.4">
+<script src="/site/{site}/app.js"></script>
+<script src="/vendor/bundle.js"></script>
+<script>
+(function(w,d,s,l,i){{w[l]=w[l]||[];w[l].push({{'gtm.start':new Date().getTime(),event:'gtm.js'}});}})(window,document,'script','dataLayer','GTM-LT{site:04d}');
+window.dataLayer = window.dataLayer || [];
+dataLayer.push({{'event': 'page_view', 'pageType': '{slug}', 'siteId': '{site}'}});
+dataLayer.push({{'event': 'add_to_cart', 'ecommerce': {{'items': 1}}}});
+</script>
+</head><body><nav>{links}</nav><main>"""
+    return pad(html, config.page_kb) + "</main></body></html>"
+
+def render_container(container_id, config):
+    body = f"""// {container_id}
+var tags = ["https://www.google-analytics.com/g/collect", "measurement_id: G-LOADTEST",
+            "https://www.googleadservices.com/pagead/conversion", "AW-123456789",
+            "https://connect.facebook.net/en_US/fbevents.js"];
+var triggers = ["gtm.js", "gtm.click", "gtm.formSubmit", "scroll depth"];
+var consent = "consent default ad_storage denied"; var linker = {{allowLinker: true}};
+"""
+    return pad(body, config.gtm_kb)
+
+class MockWebHandler(BaseHTTPRequestHandler):
+    config = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        config = self.config
+        time.sleep(max(0.0, random.gauss(config.latency_ms, config.jitter_ms)) / 1000)
+
+        url = urlparse(self.path)
+        site_match = re.match(r'^/site/(\d+)/(.*)$', url.path)
+        body, content_type = None, "text/html; charset=utf-8"
+
+        if url.path == "/gtm.js":
+            container_id = parse_qs(url.query).get("id", [""])[0]
+            body, content_type = render_container(container_id, config), "application/javascript"
+        elif url.path == "/vendor/bundle.js":
+            body, content_type = pad("// shared vendor bundle: connect.facebook.net\n", 40), "application/javascript"
+        elif site_match and site_match.group(2) == "app.js":
+            body, content_type = pad("// first party: static.hotjar.com\n", 20), "application/javascript"
+        elif site_match and site_match.group(2) in [""] + SUBPAGES:
+            body = render_page(int(site_match.group(1)), site_match.group(2) or "home", config)
+
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client hat wegen Deadline abgebrochen
+
+def start_mock_web(config):
+    handler = type("ConfiguredHandler", (MockWebHandler,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class StubWhois:
+    """WHOIS-Stub mit fester Latenz"""
+
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+
+    def whois(self, domain, ignore_socket_errors=True, timeout=None):
+        time.sleep(self.latency_ms / 1000)
+        return SimpleNamespace(creation_date=datetime(2012, 5, 1))
+
+class StubGenAI:
+    """Gemini-Stub (google.generativeai) mit fester Latenz"""
+
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+
+    def configure(self, api_key):
+        pass
+
+    def GenerativeModel(self, name):
+        return self
+
+    def generate_content(self, prompt, request_options=None):
+        time.sleep(self.latency_ms / 1000)
+        return SimpleNamespace(text='{"industry_refined": "E-Commerce", "headquarters_guess": "Berlin"}')
+
+
+# ==================== DRIVER ====================
+def percentile(values, pct):
+    """Nearest-Rank-Perzentil"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(pct * len(ordered) / 100)
+    return ordered[max(0, min(len(ordered) - 1, rank - 1))]
+
+def analyze_like_main(app, url):
+    """Derselbe Ablauf wie main(): Analyse, Session-Summary, Ergebnisansicht"""
+    result = app.run_analysis(url, 7)
+    if not result:
+        raise RuntimeError("Crawl fehlgeschlagen")
+    app.summarize_analysis(result)
+    app.get_analysis_view(result["id"])
+    return result
+
+def run_level(app, base_url, concurrency, requests_count, site_counter, reuse_sites):
+    latencies, errors, pages, partial = [], [], [], 0
+    lock = threading.Lock()
+
+    def one_request(_):
+        nonlocal partial
+        with lock:
+            site = 0 if reuse_sites else next(site_counter)
+        started = time.perf_counter()
+        try:
+            result = analyze_like_main(app, f"{base_url}/site/{site}/")
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            pages.append(result["crawl"]["total_pages"])
+            partial += int(result["deadline"]["partial"])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(requests_count)))
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests_count,
+        "ok": len(latencies),
+        "error_rate": round(len(errors) / requests_count, 3),
+        "partial_rate": round(partial / requests_count, 3),
+        "p50_s": round(percentile(latencies, 50) or 0, 2),
+        "p95_s": round(percentile(latencies, 95) or 0, 2),
+        "p99_s": round(percentile(latencies, 99) or 0, 2),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "avg_pages": round(sum(pages) / len(pages), 1) if pages else 0,
+        "rss_mb": app.get_process_memory_mb(),
+        "errors": sorted(set(errors))[:5]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="MarTech Analyzer Load Test")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Parallelitätsstufen, kommagetrennt")
+    parser.add_argument("--requests", type=int, default=20, help="Analysen pro Stufe")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Mittlere Antwortzeit der Mock-Sites")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="Standardabweichung der Antwortzeit")
+    parser.add_argument("--page-kb", type=int, default=80, help="Größe je HTML-Seite")
+    parser.add_argument("--gtm-kb", type=int, default=120, help="Größe je gtm.js-Container")
+    parser.add_argument("--pages", type=int, default=5, help="Verlinkte Unterseiten je Site")
+    parser.add_argument("--whois-ms", type=float, default=300, help="Latenz des WHOIS-Stubs")
+    parser.add_argument("--gemini-ms", type=float, default=800, help="Latenz des Gemini-Stubs")
+    parser.add_argument("--deadline", type=float, default=None, help="Zeitbudget pro Analyse (Standard: App-Einstellung)")
+    parser.add_argument("--reuse-sites", action="store_true", help="Immer dieselbe Site analysieren (warme Caches)")
+    parser.add_argument("--json", help="Report zusätzlich als JSON speichern")
+    args = parser.parse_args()
+
+    server = start_mock_web(args)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # Vor dem Import setzen: App liest DB-Pfad, Archiv, gtm.js-URL und Deadline beim Laden
+    workdir = tempfile.mkdtemp(prefix="martech-loadtest-")
+    os.environ["MARTECH_DB"] = os.path.join(workdir, "loadtest.db")
+    os.environ["MARTECH_ARCHIVE"] = os.path.join(workdir, "snapshots")
+    os.environ["MARTECH_GTM_JS_URL"] = f"{base_url}/gtm.js"
+    os.environ.setdefault("GEMINI_API_KEY", "loadtest")
+    if args.deadline:
+        os.environ["MARTECH_DEADLINE"] = str(args.deadline)
+
+    import app
+    app.quiet_streamlit_logs()
+
+    app.whois, app.WHOIS_AVAILABLE = StubWhois(args.whois_ms), True
+    app.genai, app.GENAI_AVAILABLE = StubGenAI(args.gemini_ms), True
+    app.init_database()
+
+    print(f"Stand-in-Web: {base_url} • DB: {os.environ['MARTECH_DB']}", file=sys.stderr)
+    site_counter = iter(range(1, 10 ** 9))
+    report = []
+    for level in [int(x) for x in args.levels.split(",")]:
+        print(f"→ Parallelität {level} ...", file=sys.stderr)
+        report.append(run_level(app, base_url, level, args.requests, site_counter, args.reuse_sites))
+
+    server.shutdown()
+
+    table = pd.DataFrame(report).drop(columns=["errors"])
+    print(table.to_string(index=False))
+    for row in report:
+        for error in row["errors"]:
+            print(f"  [{row['concurrency']}] {error}")
+
+    memory = app.get_memory_report()
+    print(pd.DataFrame(memory["caches"]).to_string(index=False))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "levels": report, "memory": memory}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+MarTech Analyzer Pro v5.0 - Monitoring Worker
+Führt die geplanten Re-Analysen der Watchlist aus (inkrementell).
+
+Start:
+python monitor_worker.py            # Dauerbetrieb
+python monitor_worker.py --once     # Ein Durchlauf (z.B. via cron)
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from app import init_database, run_due_watches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MarTech Analyzer Monitoring Worker")
+    parser.add_argument("--once", action="store_true", help="Nur einen Durchlauf ausführen")
+    parser.add_argument("--poll", type=int, default=60, help="Sekunden zwischen zwei Durchläufen")
+    args = parser.parse_args()
+    
+    init_database()
+    
+    while True:
+        for result in run_due_watches():
+            diff = result["diff"]
+            status = "⚠ ALERT" if diff.get("alert") else "ok"
+            print(f"[{datetime.now():%Y-%m-%d %H:%M}] {result['domain']}: {status} "
+                  f"(Stufen: {', '.join(result['stages_run'])})", flush=True)
+        
+        if args.once:
+            break
+        time.sleep(args.poll)
+
+
+if __name__ == "__main__":
+    main()
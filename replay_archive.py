@@ -0,0 +1,111 @@
+"""
+MarTech Analyzer Pro v5.0 - Archiv-Replay
+Spielt archivierte Captures offline (ohne Netz) durch die aktuelle Pipeline,
+z.B. nach verbesserter Detection; parallel über alle CPU-Kerne.
+
+Start:
+python replay_archive.py                                   # gesamte Historie
+python replay_archive.py --domain www.beispiel.de --since 2026-01-01
+python replay_archive.py --workers 8 --out rescored.jsonl --save
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import app
+
+
+def rescore(snapshot):
+    """Ein Capture neu bewerten (läuft im Worker-Prozess)"""
+    started = time.perf_counter()
+    result = {
+        "capture_id": snapshot["capture_id"],
+        "domain": snapshot["domain"],
+        "url": snapshot["url"],
+        "timestamp": snapshot["timestamp"],
+        "analysis_id": snapshot["analysis_id"],
+        "score_before": None,
+        "score_after": None
+    }
+
+    previous = app.load_analysis(snapshot["analysis_id"]) if snapshot["analysis_id"] else None
+    if previous:
+        result["score_before"] = previous["gtm"]["implementation_quality"]["score"]
+
+    try:
+        raw_data = app.replay_snapshot(snapshot)
+    except Exception as e:
+        raw_data, result["error"] = None, str(e)
+
+    if raw_data:
+        result.update({
+            "score_after": raw_data["gtm"]["implementation_quality"]["score"],
+            "grade": raw_data["gtm"]["implementation_quality"]["grade"],
+            "pages": raw_data["crawl"]["total_pages"],
+            "tags": raw_data["gtm"]["tags"]["total_count"],
+            "tools": raw_data["tools"]["total_count"],
+            "tracking_weight": raw_data["performance"]["score"],
+            "raw_data": raw_data
+        })
+    elif "error" not in result:
+        result["error"] = "Startseite nicht im Archiv"
+    result["replay_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MarTech Analyzer Archiv-Replay")
+    parser.add_argument("--domain", help="Nur Captures dieser Domain")
+    parser.add_argument("--since", help="Ab Zeitpunkt (ISO, z.B. 2026-01-01)")
+    parser.add_argument("--until", help="Bis Zeitpunkt (ISO)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Anzahl Prozesse")
+    parser.add_argument("--out", help="Ergebnisse als JSONL speichern")
+    parser.add_argument("--save", action="store_true", help="Neu bewertete Analysen in der DB speichern")
+    args = parser.parse_args()
+
+    app.init_database()
+    snapshots = [
+        {**row, "analysis_id": int(row["analysis_id"]) if pd.notna(row["analysis_id"]) else None}
+        for row in app.list_snapshots(args.domain, args.since, args.until).to_dict("records")
+    ]
+    if not snapshots:
+        print("Keine Captures gefunden")
+        return
+
+    started = time.perf_counter()
+    changed = failed = 0
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=app.quiet_streamlit_logs) as pool:
+        for result in pool.map(rescore, snapshots, chunksize=4):
+            raw_data = result.pop("raw_data", None)
+            if raw_data is None:
+                failed += 1
+                print(f"[{result['timestamp'][:16]}] {result['domain']}: ✗ {result['error']}", flush=True)
+                continue
+
+            if result["score_before"] != result["score_after"]:
+                changed += 1
+            print(f"[{result['timestamp'][:16]}] {result['domain']}: "
+                  f"{result['score_before']} → {result['score_after']} ({result['replay_ms']} ms)", flush=True)
+
+            if args.save:
+                raw_data["replay_of"] = result["capture_id"]
+                result["new_analysis_id"] = app.save_analysis(result["url"], result["domain"], result["score_after"], raw_data)
+            if out:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    if out:
+        out.close()
+    elapsed = time.perf_counter() - started
+    print(f"{len(snapshots)} Captures in {elapsed:.1f} s ({len(snapshots) / elapsed:.1f}/s, {args.workers} Prozesse) • "
+          f"{changed} Scores geändert • {failed} fehlgeschlagen")
+
+
+if __name__ == "__main__":
+    main()
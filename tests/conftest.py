@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Vor dem Import setzen: App liest DB-Pfad und Archiv beim Laden
+WORKDIR = tempfile.mkdtemp(prefix="martech-tests-")
+os.environ["MARTECH_DB"] = os.path.join(WORKDIR, "tests.db")
+os.environ["MARTECH_ARCHIVE"] = os.path.join(WORKDIR, "snapshots")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+app.quiet_streamlit_logs()
+app.init_database()
+
+
+# ==================== LOKALES WEB ====================
+class LocalWeb:
+    """Statische Routen (Pfad -> Status, Header, Body) mit Request-Zähler und Latenz"""
+
+    def __init__(self):
+        self.routes = {}
+        self.hits = {}
+        self.delays = {}
+        web = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                web.hits[self.path] = web.hits.get(self.path, 0) + 1
+                status, headers, body = web.routes.get(path, (404, {}, b""))
+                time.sleep(web.delays.get(path, 0))
+                self.send_response(status)
+                for name, value in {"Content-Length": str(len(body)), **headers}.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def add(self, path, body, status=200, **headers):
+        self.routes[path] = (status, {k.replace("_", "-"): v for k, v in headers.items()},
+                             body.encode("utf-8") if isinstance(body, str) else body)
+
+
+@pytest.fixture
+def web():
+    local = LocalWeb()
+    yield local
+    local.server.shutdown()
+    local.server.server_close()
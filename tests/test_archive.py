@@ -0,0 +1,125 @@
+import sqlite3
+
+import pytest
+
+import app
+
+FILLER = "<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>\n"
+BIG_PAGE = ("<html><head><title>Großer Shop</title><script src=\"/js/big.js\"></script></head><body>"
+            + FILLER * (3 * 1024 * 1024 // len(FILLER))
+            + "<script>(window,document,'script','dataLayer','GTM-TAIL1234');</script></body></html>")
+BIG_SCRIPT = "// connect.facebook.net/en_US/fbevents.js\n" + "var x = 1;\n" * 100000
+TIMING_KEYS = {"scan_ms", "elapsed_s", "ttfb_ms", "redirect_ms", "total_ms"}
+
+
+def comparable(data):
+    """Ergebnis ohne Laufzeit-Messwerte"""
+    if isinstance(data, dict):
+        return {k: comparable(v) for k, v in data.items() if k not in TIMING_KEYS and k != "combined_html"}
+    if isinstance(data, list):
+        return [comparable(v) for v in data]
+    return data
+
+
+@pytest.fixture
+def big_site(web, monkeypatch):
+    monkeypatch.setattr(app, "GTM_JS_URL", f"{web.url}/gtm.js")
+    monkeypatch.setattr(app._script_url_cache, "get", lambda key, default=None: default)
+    app.ultra_precise_gtm_analysis.clear()  # gleiches HTML wie im vorigen Test, andere gtm.js-URL
+    web.add("/", BIG_PAGE)
+    web.add("/js/big.js", BIG_SCRIPT)
+    web.add("/gtm.js", "// https://www.google-analytics.com/g/collect")
+    return web
+
+
+def test_archiving_does_not_change_the_analysis(big_site):
+    url = f"{big_site.url}/"
+    session = app.ArchiveSession(url)
+    try:
+        archived = app.run_pipeline(url, 1, app.Deadline(30), session)
+        session.flush(None)
+    finally:
+        session.close()
+    plain = app.run_pipeline(url, 1, app.Deadline(30))
+
+    assert "GTM-TAIL1234" in archived["gtm"]["containers"]
+    assert len(archived["crawl"]["combined_html"]) == len(plain["crawl"]["combined_html"])
+    assert archived["scripts"]["bytes_downloaded"] <= app.SCRIPT_MAX_BYTES
+    assert comparable(archived) == comparable(plain)
+
+def test_replay_matches_live_run(big_site):
+    url = f"{big_site.url}/"
+    session = app.ArchiveSession(url)
+    try:
+        live = app.run_pipeline(url, 1, app.Deadline(30), session)
+        session.flush(None)
+    finally:
+        session.close()
+
+    snapshot = app.list_snapshots(since=session.timestamp).to_dict("records")[-1]
+    replayed = app.replay_snapshot(snapshot, max_pages=1)
+    assert replayed["gtm"]["containers"] == live["gtm"]["containers"]
+    assert replayed["scripts"]["tags"] == live["scripts"]["tags"]
+    assert replayed["performance"]["totals"] == live["performance"]["totals"]
+
+def test_partially_read_response_is_archived_as_truncated(big_site):
+    url = f"{big_site.url}/js/big.js"
+    session = app.ArchiveSession(url)
+    try:
+        content, truncated, _ = app.fetch_script_capped(url, 64 * 1024, session=session)
+        session.flush(None)
+    finally:
+        session.close()
+
+    record = app.read_warc_record(*app.load_capture_records(session.capture_id)[url])
+    assert truncated and len(content) == 64 * 1024
+    assert record["fields"]["WARC-Truncated"] == "unspecified"
+    assert len(app.parse_http_block(record["block"])[3]) < len(BIG_SCRIPT)
+
+def capture(url, fn):
+    session = app.ArchiveSession(url)
+    try:
+        result = fn(session)
+        session.flush(None)
+    finally:
+        session.close()
+    return result, app.list_snapshots(since=session.timestamp).to_dict("records")[-1]
+
+def test_replay_does_not_load_pages_from_older_captures(web, monkeypatch):
+    monkeypatch.setattr(app, "GTM_JS_URL", f"{web.url}/gtm.js")
+    web.add("/", '<html><a href="/about">Über uns</a></html>')
+    web.add("/about", "<script>'GTM-OLD1234'</script>")
+    url = f"{web.url}/"
+    capture(url, lambda session: app.run_pipeline(url, 2, app.Deadline(30), session))
+    # Zweiter Lauf: /about antwortet nicht mehr rechtzeitig, kein Record im Capture
+    web.delays["/about"] = 3
+    _, snapshot = capture(url, lambda session: app.run_pipeline(url, 2, app.Deadline(3), session))
+
+    replayed = app.replay_snapshot(snapshot, max_pages=2)
+    assert replayed["crawl"]["total_pages"] == 1
+    assert "GTM-OLD1234" not in replayed["gtm"]["containers"]
+
+def test_cache_hits_and_not_modified_replay_via_revisits(web, monkeypatch):
+    monkeypatch.setattr(app, "GTM_JS_URL", f"{web.url}/gtm.js")
+    web.add("/", '<html><script src="/js/pixel.js"></script><script>\'GTM-REV1234\'</script></html>', ETag='"v1"')
+    web.add("/js/pixel.js", "// connect.facebook.net/en_US/fbevents.js")
+    web.add("/gtm.js", "// https://www.google-analytics.com/g/collect")
+    url = f"{web.url}/"
+    first, _ = capture(url, lambda session: app.run_pipeline(url, 1, app.Deadline(30), session, page_cache={}))
+
+    # Zweiter Lauf: Seite 304, gtm.js & Script aus den Prozess-Caches
+    web.add("/", b"", status=304)
+    page_cache = first["crawl"]["page_states"]
+    live, snapshot = capture(url, lambda session: app.run_pipeline(url, 1, app.Deadline(30), session,
+                                                                    page_cache=page_cache))
+    assert web.hits["/js/pixel.js"] == 1 and web.hits["/gtm.js?id=GTM-REV1234"] == 1
+    conn = sqlite3.connect(app.DB_PATH)
+    record_types = conn.execute("SELECT url, record_type FROM snapshot_records WHERE capture_id = ?",
+                                (snapshot["capture_id"],)).fetchall()
+    conn.close()
+    assert {(u.replace(web.url, ""), t) for u, t in record_types if "://" in u} == {
+        ("/", "revisit"), ("/js/pixel.js", "revisit"), ("/gtm.js?id=GTM-REV1234", "revisit")}
+
+    replayed = app.replay_snapshot(snapshot, max_pages=1)
+    assert replayed["gtm"]["containers"] == live["gtm"]["containers"] == ["GTM-REV1234"]
+    assert replayed["scripts"]["tags"] == live["scripts"]["tags"] == first["scripts"]["tags"]
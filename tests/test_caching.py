@@ -0,0 +1,56 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def cache():
+    caches = []
+
+    def make(max_bytes=100, ttl=None):
+        caches.append(app.BoundedCache("test", max_bytes, ttl))
+        return caches[-1]
+    yield make
+    for c in caches:
+        app._caches.remove(c)
+
+
+def test_evicts_least_recently_used(cache):
+    c = cache(max_bytes=30)
+    c.set("a", 1, size=10)
+    c.set("b", 2, size=10)
+    c.set("c", 3, size=10)
+    assert c.get("a") == 1  # a ist jetzt zuletzt benutzt
+    c.set("d", 4, size=10)
+
+    assert c.get("b") is None
+    assert [c.get(k) for k in "acd"] == [1, 3, 4]
+    assert c.stats()["evictions"] == 1
+
+def test_expired_entries_are_dropped(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app.time, "time", lambda: now[0])
+    c = cache(ttl=60)
+    c.set("a", 1, size=10)
+    now[0] += 59
+    assert c.get("a") == 1
+    now[0] += 2
+    assert c.get("a", "weg") == "weg"
+    assert c.stats()["entries"] == 0
+
+def test_byte_budget_is_never_exceeded(cache):
+    c = cache(max_bytes=100)
+    for i in range(10):
+        c.set(i, "x", size=30)
+        assert c._bytes <= 100
+    assert c.stats()["entries"] == 3
+    c.set(9, "y", size=60)  # Ersetzen rechnet die alte Größe heraus
+    assert c._bytes == 90 and c.get(9) == "y"
+
+def test_oversized_value_drops_the_old_entry(cache):
+    c = cache(max_bytes=100)
+    c.set("a", "alt", size=10)
+    c.set("a", "neu", size=200)
+
+    assert c.get("a") is None
+    assert c.stats()["entries"] == 0 and c._bytes == 0
@@ -0,0 +1,37 @@
+import pytest
+
+import app
+
+
+def linked_home(web, count):
+    links = "".join(f'<a href="/about-{i}">Über uns {i}</a>' for i in range(count))
+    web.add("/", f"<html>{links}</html>")
+    return f"{web.url}/"
+
+
+def test_stops_after_pages_without_new_signals(web):
+    url = linked_home(web, 6)
+    for i in range(6):
+        web.add(f"/about-{i}", "<html>immer gleich</html>")
+    crawl_data = app.crawl_multiple_pages(url, 7, adaptive=True)
+
+    assert crawl_data["total_pages"] == 1 + app.ADAPTIVE_PATIENCE
+    assert crawl_data["adaptive"]["stop_reason"] == "keine neuen Signale"
+
+def test_budget_grows_while_pages_add_signals(web):
+    url = linked_home(web, 1)
+    for i in range(20):
+        web.add(f"/about-{i}", f"<html>'GTM-NEW{i:04d}'<a href=\"/about-{i + 1}\">mehr</a></html>")
+    crawl_data = app.crawl_multiple_pages(url, 3, adaptive=True)
+
+    assert crawl_data["adaptive"]["budget"] == app.ADAPTIVE_MAX_PAGES
+    assert crawl_data["total_pages"] == app.ADAPTIVE_MAX_PAGES
+    assert crawl_data["adaptive"]["stop_reason"] == "Seitenbudget erreicht"
+
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_failed_subpages_count_against_the_budget(web, adaptive):
+    url = linked_home(web, 25)
+    crawl_data = app.crawl_multiple_pages(url, 3, adaptive=adaptive)
+
+    assert crawl_data["total_pages"] == 1
+    assert sum(web.hits.values()) == 3
@@ -0,0 +1,137 @@
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import pytest
+
+import app
+
+
+def test_call_with_timeout_returns_result():
+    assert app.call_with_timeout("whois", lambda x: x * 2, 1, 21) == 42
+
+def test_hanging_dependency_does_not_starve_the_other():
+    release = threading.Event()
+    workers = app._blocking_pools["whois"]._max_workers
+    try:
+        # Alle WHOIS-Worker hängen, dazu ein wartender Aufruf
+        for _ in range(workers + 1):
+            with pytest.raises(FutureTimeout):
+                app.call_with_timeout("whois", release.wait, 0.05)
+        started = time.monotonic()
+        assert app.call_with_timeout("gemini", lambda: "ok", 1) == "ok"
+        assert time.monotonic() - started < 0.5
+    finally:
+        release.set()
+
+def test_timed_out_queued_call_is_cancelled():
+    release = threading.Event()
+    calls = []
+    workers = app._blocking_pools["whois"]._max_workers
+    try:
+        for _ in range(workers):
+            with pytest.raises(FutureTimeout):
+                app.call_with_timeout("whois", release.wait, 0.05)
+        with pytest.raises(FutureTimeout):
+            app.call_with_timeout("whois", calls.append, 0.05, "queued")
+    finally:
+        release.set()
+    time.sleep(0.2)
+    assert calls == []
+
+def test_company_intelligence_passes_timeouts_to_clients(monkeypatch):
+    seen = {}
+
+    class Whois:
+        def whois(self, domain, ignore_socket_errors=True, timeout=None):
+            seen["whois"] = timeout
+            return None
+
+    class GenAI:
+        def configure(self, api_key):
+            pass
+
+        def GenerativeModel(self, name):
+            return self
+
+        def generate_content(self, prompt, request_options=None):
+            seen["gemini"] = request_options["timeout"]
+            raise RuntimeError("offline")
+
+    monkeypatch.setattr(app, "whois", Whois(), raising=False)
+    monkeypatch.setattr(app, "WHOIS_AVAILABLE", True)
+    monkeypatch.setattr(app, "genai", GenAI(), raising=False)
+    monkeypatch.setattr(app, "GENAI_AVAILABLE", True)
+    monkeypatch.setattr(app, "get_gemini_api_key", lambda: "test")
+
+    app.get_company_intelligence_ai.__wrapped__("beispiel.de", "<html></html>", app.Deadline(30))
+    assert seen == {"whois": 8, "gemini": 15}
+
+def test_gtm_timeout_is_partial_and_not_cached(web, monkeypatch):
+    monkeypatch.setattr(app, "GTM_JS_URL", f"{web.url}/gtm.js")
+    web.add("/gtm.js", "// https://www.google-analytics.com/g/collect")
+    web.delays["/gtm.js"] = 2
+    html = "<script>'GTM-SLOW1234'</script>"
+
+    deadline = app.Deadline(1.5)
+    gtm_data = app.run_stage(app.ultra_precise_gtm_analysis, html, _deadline=deadline)
+    assert gtm_data["partial"]
+    assert deadline.report()["skipped"][0]["stage"] == "gtm"
+
+    web.delays["/gtm.js"] = 0
+    gtm_data = app.run_stage(app.ultra_precise_gtm_analysis, html, _deadline=app.Deadline(20))
+    assert gtm_data["container_details"]["GTM-SLOW1234"]["accessible"]
+
+def test_client_timeouts_count_as_skipped(monkeypatch):
+    class Whois:
+        def whois(self, domain, ignore_socket_errors=True, timeout=None):
+            raise TimeoutError("timed out")
+
+    class DeadlineExceeded(Exception):
+        pass
+
+    class GenAI:
+        def configure(self, api_key):
+            pass
+
+        def GenerativeModel(self, name):
+            return self
+
+        def generate_content(self, prompt, request_options=None):
+            raise DeadlineExceeded("504 Deadline Exceeded")
+
+    monkeypatch.setattr(app, "whois", Whois(), raising=False)
+    monkeypatch.setattr(app, "WHOIS_AVAILABLE", True)
+    monkeypatch.setattr(app, "genai", GenAI(), raising=False)
+    monkeypatch.setattr(app, "GENAI_AVAILABLE", True)
+    monkeypatch.setattr(app, "get_gemini_api_key", lambda: "test")
+
+    deadline = app.Deadline(30)
+    with pytest.raises(app.PartialResult):
+        app.get_company_intelligence_ai.__wrapped__("timeout.de", "<html></html>", deadline)
+    assert [s["detail"] for s in deadline.report()["skipped"]] == ["WHOIS übersprungen", "Gemini übersprungen"]
+
+def crawl_site(web):
+    web.add("/", '<html><a href="/about">Über uns</a><a href="/contact">Kontakt</a></html>')
+    web.add("/about", "<html>about</html>")
+    web.add("/contact", "<html>contact</html>")
+    return f"{web.url}/"
+
+def test_slow_subpage_leaves_half_the_budget(web):
+    url = crawl_site(web)
+    web.delays["/about"] = 5
+    deadline = app.Deadline(4)
+    crawl_data = app.crawl_multiple_pages(url, 3, deadline=deadline, adaptive=False)
+
+    assert crawl_data["total_pages"] == 1
+    assert deadline.remaining() > 4 * app.CRAWL_BUDGET_SHARE - 0.5
+    assert any("Timeout" in s["detail"] for s in deadline.report()["skipped"])
+
+def test_exhausted_crawl_budget_is_reported(web):
+    url = crawl_site(web)
+    deadline = app.Deadline(0.8)
+    crawl_data = app.crawl_multiple_pages(url, 3, deadline=deadline, adaptive=False)
+
+    assert crawl_data["total_pages"] == 1
+    assert deadline.report()["partial"]
+    assert deadline.report()["skipped"][0]["stage"] == "crawl"
@@ -0,0 +1,77 @@
+import sqlite3
+
+import pytest
+
+import app
+
+PAGE = """<html><head><title>Shop</title>
+<script src="/js/app.js"></script>
+<script>(function(w,d,s,l,i){})(window,document,'script','dataLayer','GTM-MON1234');</script>
+</head><body>Willkommen</body></html>"""
+
+
+@pytest.fixture
+def site(web, monkeypatch):
+    monkeypatch.setattr(app, "GTM_JS_URL", f"{web.url}/gtm.js")
+    web.add("/", PAGE)
+    web.add("/js/app.js", "// first party")
+    web.add("/gtm.js", "// https://www.google-analytics.com/g/collect")
+    return web
+
+
+def snapshot_row(capture_id):
+    conn = sqlite3.connect(app.DB_PATH)
+    row = conn.execute("SELECT analysis_id FROM snapshots WHERE capture_id = ?", (capture_id,)).fetchone()
+    conn.close()
+    return row
+
+
+def test_unchanged_site_reuses_all_stages(site):
+    first, stages = app.run_incremental_analysis(f"{site.url}/")
+    assert stages == ["crawl", "gtm", "scripts", "performance", "tools", "company"]
+
+    second, stages = app.run_incremental_analysis(f"{site.url}/", app.load_analysis(first["id"]))
+    assert stages == ["crawl"]
+    assert second["gtm"] == first["gtm"]
+    assert snapshot_row(second["snapshot"]) == (second["id"],)
+
+def test_changed_container_is_analyzed_fresh(site):
+    first, _ = app.run_incremental_analysis(f"{site.url}/")
+    assert set(first["gtm"]["tags"]["by_type"]) == {"Google Analytics 4"}
+
+    # Gleiches HTML, neue gtm.js: darf nicht aus dem GTM-Cache kommen
+    site.add("/gtm.js", "// https://www.google-analytics.com/g/collect connect.facebook.net")
+    second, stages = app.run_incremental_analysis(f"{site.url}/", app.load_analysis(first["id"]))
+    assert stages == ["crawl", "gtm", "performance"]
+    assert set(second["gtm"]["tags"]["by_type"]) == {"Google Analytics 4", "Meta Pixel"}
+
+def test_changed_script_at_same_url_is_scanned_fresh(site):
+    first, _ = app.run_incremental_analysis(f"{site.url}/")
+    assert first["scripts"]["tags"] == {}
+
+    # Gleiche Script-URL, neuer Inhalt: darf nicht aus dem URL-Cache kommen
+    site.add("/js/app.js", "// connect.facebook.net/en_US/fbevents.js")
+    second, stages = app.run_incremental_analysis(f"{site.url}/", app.load_analysis(first["id"]))
+    assert stages == ["crawl", "scripts", "performance"]
+    assert set(second["scripts"]["tags"]) == {"Meta Pixel"}
+
+def test_container_skipped_by_deadline_counts_as_changed(site):
+    deadline = app.Deadline(0)
+    assert app.check_container_changes(["GTM-MON1234"], deadline) == ["GTM-MON1234"]
+    assert deadline.report()["skipped"][0]["stage"] == "monitor"
+
+def test_failing_stage_still_flushes_and_closes_capture(site, monkeypatch):
+    sessions = []
+    start_capture = app.start_capture
+    monkeypatch.setattr(app, "start_capture", lambda url: sessions.append(start_capture(url)) or sessions[-1])
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("kaputt")
+    monkeypatch.setattr(app, "analyze_performance_impact", broken)
+
+    with pytest.raises(RuntimeError):
+        app.run_incremental_analysis(f"{site.url}/")
+    session = sessions[0]
+    assert snapshot_row(session.capture_id) == (None,)
+    assert session.records == []
+    assert not session.adapters["http://"].poolmanager.pools
@@ -0,0 +1,63 @@
+import gzip
+
+import app
+
+SCRIPT = "window.fbq = function() {}; // connect.facebook.net/en_US/fbevents.js\n" * 400
+CONTAINER = "// gtm.js gtm.click consent default ad_storage\n" * 300
+
+
+def analyze(web, monkeypatch, page):
+    monkeypatch.setattr(app, "GTM_JS_URL", f"{web.url}/gtm.js")
+    gtm_data = app.ultra_precise_gtm_analysis.__wrapped__(page)
+    script_data = app.scan_scripts("https://www.shop.de/", [f"{web.url}/perf/pixel.js"])
+    return app.analyze_performance_impact(gtm_data, script_data)
+
+
+def test_measures_during_scan_without_second_download(web, monkeypatch):
+    body = gzip.compress(SCRIPT.encode())
+    web.add("/perf/pixel.js", body, Content_Encoding="gzip", Cache_Control="public, max-age=3600")
+    web.add("/gtm.js", CONTAINER)
+    perf = analyze(web, monkeypatch, "<script>'GTM-PERF123'</script>")
+
+    assert web.hits == {"/perf/pixel.js": 1, "/gtm.js?id=GTM-PERF123": 1}
+    resources = {r["kind"]: r for r in perf["resources"]}
+    assert resources["script"]["wire_bytes"] == len(body)
+    assert resources["script"]["decoded_bytes"] == len(SCRIPT)
+    assert resources["script"]["encoding"] == "gzip"
+    assert resources["script"]["cache"]["max_age"] == 3600
+    assert resources["gtm"]["wire_bytes"] == len(CONTAINER)
+    assert perf["totals"]["resources"] == 2
+    assert perf["totals"]["uncompressed"] == 1  # gtm.js ohne gzip
+    assert perf["totals"]["not_cacheable"] == 1
+
+
+def test_unreachable_resources_are_skipped(web, monkeypatch):
+    perf = analyze(web, monkeypatch, "<script>'GTM-MISSING1'</script>")
+    assert perf["totals"]["resources"] == 0
+    assert {s["reason"] for s in perf["skipped"]} == {"Nicht erreichbar"}
+    assert len(perf["skipped"]) == 2
+
+
+def test_truncated_script_uses_content_length(web, monkeypatch):
+    body = SCRIPT.encode() * 40  # > SCRIPT_MAX_BYTES
+    web.add("/perf/pixel.js", body)
+    perf = analyze(web, monkeypatch, "<html></html>")
+
+    script = perf["resources"][0]
+    assert script["truncated"] and script["size_exact"]
+    assert script["wire_bytes"] == script["decoded_bytes"] == len(body)
+    assert perf["by_tag"]["Meta Pixel"]["truncated"] == 1
+    assert perf["totals"]["lower_bound"] == 0
+    assert perf["score"] <= 60  # Größen-Abzug voll angerechnet
+
+
+def test_truncated_script_without_length_is_a_lower_bound(web, monkeypatch):
+    web.add("/perf/pixel.js", SCRIPT.encode() * 40, Content_Length="")
+    perf = analyze(web, monkeypatch, "<html></html>")
+
+    script = perf["resources"][0]
+    assert script["truncated"] and not script["size_exact"]
+    assert script["wire_bytes"] >= app.SCRIPT_MAX_BYTES
+    assert perf["totals"]["lower_bound"] == 1
+    assert perf["by_tag"]["Meta Pixel"]["truncated"] == 1
+    assert perf["score"] >= 80  # Untergrenze geht nicht in den Größen-Abzug ein
@@ -0,0 +1,91 @@
+import pytest
+
+import app
+
+
+def detected(html, script_urls=(), cookies=()):
+    return set(app.detect_tools(html, script_urls, cookies)["tools"])
+
+
+# ==================== HOST TRIE ====================
+def test_host_trie_matches_domain_and_subdomains():
+    trie = app.HostTrie()
+    trie.add("doubleclick.net", 1)
+    trie.add("fls.doubleclick.net", 2)
+    assert set(trie.match("doubleclick.net")) == {1}
+    assert set(trie.match("fls.doubleclick.net")) == {1, 2}
+    assert set(trie.match("ad.fls.doubleclick.net")) == {1, 2}
+
+def test_host_trie_requires_label_boundary():
+    trie = app.HostTrie()
+    trie.add("doubleclick.net", 1)
+    assert not list(trie.match("notdoubleclick.net"))
+    assert not list(trie.match("doubleclick.network"))
+
+
+# ==================== PATTERN AUTOMATON ====================
+def test_automaton_finds_all_patterns_including_prefixes():
+    automaton = app.PatternAutomaton({"gtm": [1], "gtm.js": [2], "fbq(": [3], "unused": [4]})
+    assert automaton.search("load gtm.js then fbq('init')") == {"gtm", "gtm.js", "fbq("}
+
+def test_automaton_reports_match_positions():
+    automaton = app.PatternAutomaton({"ab": [1], "abc": [2]})
+    assert sorted(automaton.finditer("xabc ab")) == [("ab", 1), ("ab", 5), ("abc", 1)]
+
+def test_automaton_match_prefixes():
+    automaton = app.PatternAutomaton({"_ga": [1], "_ga_": [2], "_gid": [3]})
+    assert set(automaton.match_prefixes("_ga_abc123")) == {"_ga", "_ga_"}
+    assert automaton.match_prefixes("x_ga") == []
+
+def test_empty_automaton():
+    automaton = app.PatternAutomaton({})
+    assert automaton.search("anything") == set()
+    assert automaton.match_prefixes("anything") == []
+
+
+# ==================== TOKEN BOUNDARIES ====================
+@pytest.mark.parametrize("text, pattern, kind, expected", [
+    ("btn-secondary", "econda", "globals", False),
+    ("window.econda = {}", "econda", "globals", True),
+    ("boomr_config", "boomr", "globals", False),
+    ("ruxitagentjs_ica2", "ruxitagentjs", "html", True),
+    ("/js/chat.js", "at.js", "html", False),
+])
+def test_at_token_boundary(text, pattern, kind, expected):
+    assert app.at_token_boundary(text, text.index(pattern), pattern, kind) is expected
+
+
+# ==================== DETECTION ====================
+@pytest.mark.parametrize("html, tool", [
+    ('<a class="btn-secondary">Mehr</a>', "econda"),
+    ('<script src="/js/chat.js"></script>', "Adobe Target"),
+    ("<p>LED floodlight für Sportplätze</p>", "Google Campaign Manager 360"),
+    ('<a href="/contao-news">News</a>', "Contao"),
+    ("<p>Wir vergleichen Shopware, WooCommerce und Contao</p>", "Shopware"),
+    ("<p>Wir vergleichen Shopware, WooCommerce und Contao</p>", "WooCommerce"),
+    ("<p>Rufen Sie an, callrail hin oder her</p>", "CallRail"),
+    ('<a href="https://de.trustpilot.com/review/shop.de">Bewertungen</a>', "Trustpilot"),
+    ('<a href="https://calendly.com/shop/termin">Termin buchen</a>', "Calendly"),
+    ('<a href="//www.surveymonkey.com/r/ABC123">Umfrage</a>', "SurveyMonkey"),
+])
+def test_no_false_positives(html, tool):
+    assert tool not in detected(html)
+
+@pytest.mark.parametrize("html, tool", [
+    ('<script src="https://cdn.example.de/target/at.js"></script>', "Adobe Target"),
+    ('<link href="/bundles/contaocore/style.css">', "Contao"),
+    ('<meta name="generator" content="Contao Open Source CMS">', "Contao"),
+    ("<script>(adsbygoogle = window.adsbygoogle || []).push({});</script>", "Google AdSense"),
+    ('<script src="/wp-content/plugins/woocommerce/assets/js/cart.js"></script>', "WooCommerce"),
+    ("<script>window.BOOMR = window.BOOMR || {};</script>", "Akamai mPulse"),
+    ('<script async src="https://widget.trustpilot.com/bootstrap/v5/tp.widget.bootstrap.min.js"></script>', "Trustpilot"),
+    ('<iframe title="Termin" src="https://calendly.com/shop/termin"></iframe>', "Calendly"),
+    ('<img alt="" src=//widget.surveymonkey.com/pixel.gif>', "SurveyMonkey"),
+    ('<link rel="preconnect" href="https://assets.calendly.com">', "Calendly"),
+])
+def test_detects_content_patterns(html, tool):
+    assert tool in detected(html)
+
+def test_detects_hosts_and_cookies():
+    tools = detected("<html></html>", ["https://fls.doubleclick.net/activityi"], ["_ga_ABC123"])
+    assert {"Google Campaign Manager 360", "Google Analytics 4"} <= tools